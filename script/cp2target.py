@@ -10,20 +10,31 @@ dir_target.mkdir(parents=True, exist_ok=True)
 
 dir_output = Path("./data") / "out"
 
+# output file -> target directory, relative to the directory of a document, see flow_pdf/compare.py
+target_files = {
+    "big_blocks_id.json": "big_blocks_id",
+    "output/doc.json": "doc",
+}
+
+
+def read_shot_rects(d: Path) -> dict:
+    return {f.name: file.read_json(f) for f in d.glob("*.json")}
+
+
+def is_changed(f: Path) -> bool:
+    dir_dest = dir_target / f.name
+    for name, dest in target_files.items():
+        file_dest = dir_dest / dest / Path(name).name
+        if (f / name).exists() and (not file_dest.exists() or file.read_json(f / name) != file.read_json(file_dest)):
+            return True
+    return (f / "shot_rects").exists() and read_shot_rects(f / "shot_rects") != read_shot_rects(dir_dest / "shot_rects")
+
+
 changed_list = []
 
 for f in sorted(dir_output.glob("*")):
-    file_id = f / "big_blocks_id.json"
-    dir_dest = dir_target / f.name / "big_blocks_id"
-    if file_id.exists():
-        if not dir_dest.exists():
-            changed_list.append(f)
-        else:
-            cur = file.read_json(file_id)
-            expect = file.read_json(dir_dest / "big_blocks_id.json")
-
-            if cur != expect:
-                changed_list.append(f)
+    if (f / "big_blocks_id.json").exists() and is_changed(f):
+        changed_list.append(f)
 
 if changed_list:
     print('please input the index of the accepted files, like "1 3", or "a" to select all')
@@ -39,8 +50,14 @@ if changed_list:
 
     for i in accepted_list:
         f = changed_list[i]
-        file_id = f / "big_blocks_id.json"
-        dir_dest = dir_target / f.name / "big_blocks_id"
-        dir_dest.mkdir(parents=True, exist_ok=True)
-        shutil.copy(file_id, dir_dest)
-        file.append_text(dir_dest / "note.txt", f"accepted time: {current_time}\n")
\ No newline at end of file
+        for name, dest in target_files.items():
+            if (f / name).exists():
+                dir_dest = dir_target / f.name / dest
+                dir_dest.mkdir(parents=True, exist_ok=True)
+                shutil.copy(f / name, dir_dest)
+        if (f / "shot_rects").exists():
+            dir_dest = dir_target / f.name / "shot_rects"
+            if dir_dest.exists():
+                shutil.rmtree(dir_dest)
+            shutil.copytree(f / "shot_rects", dir_dest)
+        file.append_text(dir_target / f.name / "big_blocks_id" / "note.txt", f"accepted time: {current_time}\n")
\ No newline at end of file
@@ -1,16 +1,22 @@
 from fastapi import FastAPI, File, UploadFile
+from fastapi.concurrency import run_in_threadpool
 import hashlib
 from pathlib import Path
 from htutil import file
-import concurrent.futures
+import threading
 import common  # type: ignore
 import time
-from worker import Executer, ExecuterConfig, workers_prod  # type: ignore
+from worker import Executer, ExecuterConfig, Progress, workers_prod, get_shared_pool  # type: ignore
+from task_queue import TaskQueue  # type: ignore
+from static_files import OutputFiles  # type: ignore
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 import shutil
-from common import version
+import os
+import uuid
+from typing import Callable
+from common import version, write_json_atomic, RateLimiter, progress_to_json
 
 
 dir_data = Path("./web-data")
@@ -19,10 +25,95 @@ dir_output = dir_data / "output"
 
 dir_fe = Path(__file__).parent.parent / "fe" / "dist"
 
+# processes of the page pool, shared by all tasks, empty means cpu count
+env_max_workers = os.getenv("FLOW_PDF_MAX_WORKERS")
+max_workers = int(env_max_workers) if env_max_workers else None
+# tasks executed at once. their pages share the page pool, so this doesn't add processes,
+# it keeps the pool busy while a task is in a doc level worker
+doc_workers = int(os.getenv("FLOW_PDF_DOC_WORKERS", "2"))
+# pending tasks at most, uploads get 429 above it
+queue_size = int(os.getenv("FLOW_PDF_QUEUE_SIZE", "32"))
+# seconds between progress writes of a task.json
+PROGRESS_INTERVAL = 1.0
+
+# bytes of an uploaded pdf at most
+max_upload_size = int(os.getenv("FLOW_PDF_MAX_UPLOAD_MB", "64")) * 1024 * 1024
+# content-length of an upload is the file plus the multipart boundaries and headers
+MULTIPART_OVERHEAD = 64 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# worker results are cached by pdf hash, so they survive restarts
+dir_cache = dir_data / "cache"
+cache_max_size = int(os.getenv("FLOW_PDF_CACHE_MAX_MB", "2048")) * 1024 * 1024
+
 for dir in [dir_data, dir_input, dir_output]:
     dir.mkdir(parents=True, exist_ok=True)
 
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class LimitUploadSize:
+    """
+    413 for a request to path with a body above max_bytes. the body is counted while the app receives it,
+    FastAPI spools a whole multipart body before the handler runs, so a chunked upload without
+    content-length has to be stopped here
+    """
+
+    def __init__(self, app, path: str, max_bytes: int):
+        self.app = app
+        self.path = path
+        self.max_bytes = max_bytes
+
+    async def reject(self, scope, receive, send):
+        response = JSONResponse(make_common_data(1, "file is too large", None), 413)
+        await response(scope, receive, send)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] != self.path:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > self.max_bytes:
+            await self.reject(scope, receive, send)
+            return
+
+        received = 0
+        too_large = False
+        started = False
+
+        async def receive_limited():
+            nonlocal received, too_large
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    too_large = True
+                    raise UploadTooLarge()
+            return message
+
+        async def send_unless_rejected(message):
+            nonlocal started
+            # the app answers the aborted body with an error of its own, 400 in FastAPI
+            if too_large and not started:
+                return
+            started = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive_limited, send_unless_rejected)
+        except Exception:
+            if not too_large:
+                raise
+        if too_large and not started:
+            await self.reject(scope, receive, send)
+
+
 app = FastAPI()
+# added first, so that CORSMiddleware also adds its headers to the 413
+app.add_middleware(LimitUploadSize, path="/api/task", max_bytes=max_upload_size + MULTIPART_OVERHEAD)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -35,48 +126,113 @@ app.add_middleware(
 logger = common.create_main_logger()
 logger.info(f"version: {version}")
 
+queue = TaskQueue(dir_data / "tasks.db", queue_size)
+for task_id in queue.requeue_executing():
+    logger.info(f"requeue executing task {task_id}")
+
 for dir_task in dir_output.glob("*"):
     file_task = dir_task / "task.json"
     if file_task.exists():
         js = file.read_json(file_task)
-        if js["status"] == "executing":
-            js["status"] = "failed"
-            logger.info(f"clean executing task {dir_task.name}")
-            file.write_json(
-                file_task,
-                js,
+        # tasks of a version without the queue
+        if js["status"] in ["pending", "executing"] and queue.get_status(dir_task.name) is None:
+            logger.info(f"clean {js['status']} task {dir_task.name}")
+            file.write_json(file_task, {"status": "error", "error": "interrupted by a restart"})
+
+# task.json is written by the upload handler and the task threads, the lock keeps the last write the newest status
+task_json_lock = threading.Lock()
+# check, replace and push of submit_task
+submit_lock = threading.Lock()
+
+
+def write_task_json(task_id: str, js: dict):
+    with task_json_lock:
+        write_json_atomic(dir_output / task_id / "task.json", js)
+
+
+def write_queue_positions():
+    """
+    queue position and estimated seconds until done of every pending task
+    """
+    mean = queue.mean_duration()
+    with task_json_lock:
+        for i, task_id in enumerate(queue.pending()):
+            write_json_atomic(
+                dir_output / task_id / "task.json",
+                {
+                    "status": "pending",
+                    "queue_position": i,
+                    "eta": round(mean * (i // doc_workers + 1), 1) if mean is not None else None,
+                },
             )
 
 
-def create_task(file_input: Path, dir_output: Path):
+def create_task(file_input: Path, dir_output: Path, on_progress: Callable[[Progress], None]):
     logger.info(f"start {file_input.name}")
     t = time.perf_counter()
 
-    file_task = dir_output / "task.json"
-
-    file.write_json(
-        file_task,
-        {
-            "status": "executing",
-        },
+    cfg = ExecuterConfig(
+        version,  # type: ignore
+        True,
+        max_workers,
+        fuse_pages=True,
+        cache_dir=dir_cache,
+        cache_max_size=cache_max_size,
+    )
+    # the page pool is shared by all tasks
+    # the input file is named after its sha256
+    e = Executer(
+        file_input, dir_output, cfg, get_shared_pool(max_workers), file_input.stem, on_progress
     )
-
-    cfg = ExecuterConfig(version, False)  # type: ignore
-    e = Executer(file_input, dir_output, cfg)
     e.register(workers_prod)
     e.execute()
 
-    file.write_json(
-        file_task,
-        {
-            "status": "done",
-        },
-    )
-
     logger.info(f"end {file_input.name}, time = {time.perf_counter() - t:.2f}s")
 
 
-poolExecutor = concurrent.futures.ProcessPoolExecutor()
+def run_tasks():
+    while True:
+        task_id = queue.pop()
+        write_task_json(task_id, {"status": "executing"})
+        write_queue_positions()
+
+        start = time.perf_counter()
+        limiter = RateLimiter(PROGRESS_INTERVAL)
+        # the Executer updates the same object
+        last_progress: list[Progress] = []
+
+        def on_progress(progress: Progress):
+            last_progress[:] = [progress]
+            if limiter.ready():
+                write_task_json(task_id, {"status": "executing", "progress": progress_to_json(progress)})
+
+        try:
+            create_task(dir_input / f"{task_id}.pdf", dir_output / task_id, on_progress)
+        except Exception as e:
+            logger.exception(f"task {task_id} error")
+            queue.finish(task_id, str(e))
+            js = {"status": "error", "error": str(e)}
+            if last_progress:
+                js["progress"] = progress_to_json(last_progress[0])
+            write_task_json(task_id, js)
+        else:
+            queue.finish(task_id)
+            write_task_json(
+                task_id,
+                {
+                    "status": "done",
+                    "time": round(time.perf_counter() - start, 2),
+                    "stage_times": progress_to_json(last_progress[0])["stage_times"] if last_progress else {},
+                },
+            )
+        write_queue_positions()
+
+
+# started before the task threads, the pool forks while this process has a single thread
+get_shared_pool(max_workers)
+write_queue_positions()
+for _ in range(doc_workers):
+    threading.Thread(target=run_tasks, name="task", daemon=True).start()
 
 
 def make_common_data(code: int, msg: str, data):
@@ -88,47 +244,75 @@ def hello():
     return make_common_data(0, "Hello", None)
 
 
-@app.post("/api/task")
-async def parse_pdf(f: UploadFile):
-    content = await f.read()
-    # task id is the sha256 hash of file content
-    task_id = hashlib.sha256(content).hexdigest()
+def write_chunk(buffer, h: "hashlib._Hash", chunk: bytes):
+    h.update(chunk)
+    buffer.write(chunk)
+
 
+def submit_task(task_id: str, file_upload: Path):
+    """
+    queues the uploaded file unless the task exists, blocking, runs in the thread pool
+    """
     dir_task = dir_output / task_id
 
-    file_task = dir_task / "task.json"
-    if file_task.exists():
-        js = file.read_json(file_task)
-        if js["status"] != "done":
+    # two uploads of the same file must not both replace the input and push
+    with submit_lock:
+        # task.json of a task pushed just now may not be written yet
+        if queue.get_status(task_id) in ["pending", "executing"]:
             return make_common_data(0, "Success", {"taskID": task_id})
-        else:
-            if file.read_json(dir_task / 'output' / 'doc.json')['meta']['flow-pdf-version'] == version:
+
+        file_task = dir_task / "task.json"
+        if file_task.exists():
+            js = file.read_json(file_task)
+            if js["status"] in ["error", "failed"]:
+                logger.info(f"retry {js['status']} task {task_id}")
+                shutil.rmtree(dir_task)
+            elif js["status"] != "done":
                 return make_common_data(0, "Success", {"taskID": task_id})
             else:
-                logger.info(f"clean old task {task_id}")
-                shutil.rmtree(dir_task)
-
-    with open(dir_input / f"{task_id}.pdf", "wb") as buffer:
-        buffer.write(content)
+                if file.read_json(dir_task / 'output' / 'doc.json')['meta']['flow-pdf-version'] == version:
+                    return make_common_data(0, "Success", {"taskID": task_id})
+                else:
+                    logger.info(f"clean old task {task_id}")
+                    shutil.rmtree(dir_task)
 
-    dir_task.mkdir(parents=True, exist_ok=True)
-    file.write_json(
-        file_task,
-        {
-            "status": "pending",
-        },
-    )
+        file_input = dir_input / f"{task_id}.pdf"
+        os.replace(file_upload, file_input)
 
-    poolExecutor.submit(create_task, dir_input / f"{task_id}.pdf", dir_output / task_id)
+        if not queue.push(task_id):
+            logger.info(f"queue is full, reject {task_id}")
+            file_input.unlink()
+            return JSONResponse(make_common_data(1, "queue is full, try again later", None), 429)
+    write_queue_positions()
 
     return make_common_data(0, "Success", {"taskID": task_id})
 
 
+@app.post("/api/task")
+async def parse_pdf(f: UploadFile):
+    # copied in chunks next to the inputs, so that the rename into input/ is atomic
+    file_upload = dir_input / f".upload-{uuid.uuid4().hex}.tmp"
+    try:
+        # task id is the sha256 hash of file content
+        h = hashlib.sha256()
+        size = 0
+        with open(file_upload, "wb") as buffer:
+            while chunk := await f.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_upload_size:
+                    return JSONResponse(make_common_data(1, "file is too large", None), 413)
+                await run_in_threadpool(write_chunk, buffer, h, chunk)
+
+        return await run_in_threadpool(submit_task, h.hexdigest(), file_upload)
+    finally:
+        await run_in_threadpool(file_upload.unlink, True)
+
+
 @app.get("/", response_class=RedirectResponse, status_code=302)
 async def redirect_index():
     return "index.html"
 
 
 # TODO ignore file log
-app.mount("/static", StaticFiles(directory=dir_output), name="static")
+app.mount("/static", OutputFiles(directory=dir_output), name="static")
 app.mount("/", StaticFiles(directory=dir_fe), name="fe")
@@ -0,0 +1,411 @@
+"""
+benchmark of the workers over a fixed corpus, usage:
+    python bench_corpus.py gen <dir_corpus>
+    python bench_corpus.py run <dir_corpus> <result.json> [--jobs N] [--rounds N] [--no-fuse] [--only a,b] [--skip a,b]
+    python bench_corpus.py compare <baseline.json> <result.json> [--threshold 0.1]
+
+gen writes the synthetic pdfs of CORPUS and corpus.json, their sha256. the pdfs are drawn from a seeded random,
+so a PyMuPDF version always writes the same bytes.
+
+run executes workers_dev on every pdf of dir_corpus, other pdfs put there included, with ExecuterConfig.measure,
+and writes the StageStats of each stage, the minimum of the rounds, and the output sizes.
+
+compare flags the metrics of a document or a stage that grew by more than threshold, and by more than MIN_DIFF,
+exits with 1 when there is one.
+"""
+import sys
+import json
+import time
+import zlib
+import random
+import hashlib
+import platform
+import argparse
+import tempfile
+import functools
+from pathlib import Path
+from dataclasses import asdict
+from typing import Callable
+
+import fitz
+
+from worker import Executer, ExecuterConfig, workers_dev, create_pool  # type: ignore
+
+WORDS = (
+    "the of distributed system consensus protocol node network block chain proof work time transaction "
+    "value hash server client replica message order latency throughput fault tolerant byzantine"
+).split()
+
+PAGE_WIDTH, PAGE_HEIGHT = 612, 792
+MARGIN_X, MARGIN_TOP, MARGIN_BOTTOM = 54, 72, 720
+COLUMN_GAP = 18
+
+# smaller differences are noise, whatever the ratio
+MIN_DIFF = {
+    "wall": 0.05,
+    "cpu": 0.05,
+    "pickled_in": 4096,
+    "pickled_out": 4096,
+    "peak_rss": 4096,
+    "output_bytes": 4096,
+}
+
+
+def sentence(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(n)).capitalize() + "."
+
+
+def columns_x(columns: int) -> list[tuple[float, float]]:
+    width = (PAGE_WIDTH - 2 * MARGIN_X - COLUMN_GAP * (columns - 1)) / columns
+    return [(MARGIN_X + i * (width + COLUMN_GAP), width) for i in range(columns)]
+
+
+def fill_box(page: fitz.Page, rect: fitz.Rect, rng: random.Random, fontsize: float = 9):
+    """
+    a justified paragraph as long as fits in rect
+    """
+    n = int(rect.width * rect.height / fontsize / 25)
+    while n > 3:
+        rc = page.insert_textbox(rect, sentence(rng, n), fontsize=fontsize, fontname="tiro", align=fitz.TEXT_ALIGN_JUSTIFY)
+        if rc >= 0:
+            return
+        n = n * 9 // 10
+
+
+def header(page: fitz.Page, page_index: int):
+    page.insert_text((MARGIN_X, 50), f"Synthetic corpus, page {page_index + 1}", fontsize=8, fontname="helv")
+
+
+def gen_columns(page: fitz.Page, page_index: int, rng: random.Random, columns: int):
+    """
+    paragraphs in columns, a figure box with a caption now and then
+    """
+    header(page, page_index)
+    for x0, width in columns_x(columns):
+        y = MARGIN_TOP
+        while y < MARGIN_BOTTOM - 40:
+            if rng.random() < 0.1:
+                h = min(rng.choice([60, 80, 100]), MARGIN_BOTTOM - y - 20)
+                page.draw_rect(fitz.Rect(x0, y, x0 + width, y + h), color=(0, 0, 0))
+                page.insert_text((x0, y + h + 12), f"Figure {rng.randint(1, 99)}: {sentence(rng, 4)}", fontsize=8)
+                y += h + 24
+                continue
+            # more than the 50 words of a big block in the narrow columns too
+            h = min(rng.choice([100, 130, 160]), MARGIN_BOTTOM - y)
+            fill_box(page, fitz.Rect(x0, y, x0 + width, y + h), rng)
+            y += h + 10
+
+
+def math_span(rng: random.Random) -> tuple[str, str, float, float]:
+    """
+    text, font, size and baseline shift of a piece of a formula
+    """
+    kind = rng.random()
+    if kind < 0.4:
+        return rng.choice("xyzabnkt"), "tiit", 10, 0
+    if kind < 0.6:
+        return rng.choice("αβγδΣπθλμσω"), "symb", 10, 0
+    if kind < 0.8:
+        return rng.choice(["+", "-", "=", "(", ")", "/"]), "tiro", 10, 0
+    return rng.choice("ij12n"), "tiit", 6.5, rng.choice([3, -4])
+
+
+@functools.cache
+def get_font(name: str) -> fitz.Font:
+    return fitz.Font(name)
+
+
+def span_length(spans: list[tuple[str, str, float, float]]) -> float:
+    return sum(get_font(font).text_length(text, fontsize=size) + 1.5 for text, font, size, _ in spans)
+
+
+def append_spans(writer: fitz.TextWriter, x: float, y: float, spans: list[tuple[str, str, float, float]]):
+    for text, font, size, dy in spans:
+        writer.append((x, y - dy), text, font=get_font(font), fontsize=size)
+        x += span_length([(text, font, size, dy)])
+
+
+def gen_formula(page: fitz.Page, page_index: int, rng: random.Random):
+    """
+    two columns of text lines with inline math, and display formulas between them
+    """
+    header(page, page_index)
+    # one text object per page, insert_text per span would add a font and a content stream each time
+    writer = fitz.TextWriter(page.rect)
+    for x0, width in columns_x(2):
+        y = MARGIN_TOP + 10
+        while y < MARGIN_BOTTOM:
+            if rng.random() < 0.2:
+                append_spans(writer, x0 + width * 0.2, y + 6, [math_span(rng) for _ in range(rng.randint(5, 12))])
+                y += 28
+                continue
+            x = x0
+            while True:
+                if rng.random() < 0.25:
+                    spans = [math_span(rng) for _ in range(rng.randint(1, 3))]
+                else:
+                    spans = [(rng.choice(WORDS), "tiro", 9.5, 0)]
+                if x + span_length(spans) > x0 + width:
+                    break
+                append_spans(writer, x, y, spans)
+                x += span_length(spans) + 1.5
+            y += 12
+    writer.write_text(page)
+
+
+def gen_drawing(page: fitz.Page, page_index: int, rng: random.Random):
+    """
+    four charts per page, bars, polylines, markers and grid lines, with tick labels and a caption
+    """
+    header(page, page_index)
+    shape = page.new_shape()
+    for k in range(4):
+        x0 = MARGIN_X + (k % 2) * 260
+        y0 = MARGIN_TOP + (k // 2) * 320
+        w, h = 230, 220
+        for i in range(6):
+            y = y0 + h - i * h / 5
+            shape.draw_line((x0, y), (x0 + w, y))
+            page.insert_text((x0 - 16, y + 3), str(i * 20), fontsize=6, fontname="helv")
+        shape.finish(color=(0.8, 0.8, 0.8), width=0.3)
+        shape.draw_line((x0, y0), (x0, y0 + h))
+        shape.draw_line((x0, y0 + h), (x0 + w, y0 + h))
+        shape.finish(color=(0, 0, 0), width=0.8)
+
+        n = rng.randint(10, 30)
+        for i in range(n):
+            bar_h = rng.uniform(0.1, 0.9) * h
+            shape.draw_rect(fitz.Rect(x0 + i * w / n + 1, y0 + h - bar_h, x0 + (i + 0.6) * w / n, y0 + h))
+        shape.finish(color=(0, 0, 0.5), fill=(0.4, 0.6, 0.9), width=0.2)
+
+        points = [fitz.Point(x0 + i * w / 60, y0 + h * rng.uniform(0.1, 0.9)) for i in range(61)]
+        shape.draw_polyline(points)
+        shape.finish(color=(0.8, 0.1, 0.1), width=0.7)
+        for p in points[::4]:
+            shape.draw_circle(p, 1.5)
+        shape.finish(color=(0.8, 0.1, 0.1), fill=(1, 1, 1), width=0.5)
+
+        fill_box(page, fitz.Rect(x0, y0 + h + 8, x0 + w, y0 + h + 80), rng, 8)
+    shape.commit()
+
+
+# name -> page count and the function drawing a page
+CORPUS: dict[str, tuple[int, Callable]] = {
+    "single_column": (20, functools.partial(gen_columns, columns=1)),
+    "double_column": (20, functools.partial(gen_columns, columns=2)),
+    "triple_column": (20, functools.partial(gen_columns, columns=3)),
+    "formula_dense": (20, gen_formula),
+    "drawing_heavy": (20, gen_drawing),
+    "long_1000": (1000, functools.partial(gen_columns, columns=2)),
+}
+
+
+def file_sha256(f: Path) -> str:
+    return hashlib.sha256(f.read_bytes()).hexdigest()
+
+
+def gen_doc(name: str, f: Path):
+    """
+    writes the document name of CORPUS to f
+    """
+    page_count, draw = CORPUS[name]
+    rng = random.Random(zlib.crc32(name.encode()))
+    doc = fitz.open()
+    for i in range(page_count):
+        draw(doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT), i, rng)
+    doc.set_metadata({})
+    doc.save(f, garbage=3, deflate=True, no_new_id=True)
+    doc.close()
+
+
+def gen(dir_corpus: Path):
+    dir_corpus.mkdir(parents=True, exist_ok=True)
+    hashes = {}
+    for name, (page_count, _) in CORPUS.items():
+        start = time.perf_counter()
+        f = dir_corpus / f"{name}.pdf"
+        gen_doc(name, f)
+        hashes[f.name] = file_sha256(f)
+        print(f"{f.name}: {page_count} pages, {f.stat().st_size / 1024:.0f}KB, time = {time.perf_counter() - start:.2f}s")
+    (dir_corpus / "corpus.json").write_text(
+        json.dumps({"pymupdf": fitz.VersionBind, "files": hashes}, indent=4)
+    )
+
+
+def measure_doc(file_input: Path, executor, fuse: bool) -> dict:
+    with tempfile.TemporaryDirectory() as d:
+        e = Executer(file_input, Path(d), ExecuterConfig("bench", False, fuse_pages=fuse, measure=True), executor)
+        e.register(workers_dev)
+        start = time.perf_counter()
+        e.execute()
+        wall = time.perf_counter() - start
+
+        outputs: dict[str, int] = {}
+        for f in Path(d).rglob("*"):
+            if f.is_file() and f.name != "log.txt":
+                part = f.relative_to(d).parts[0]
+                outputs[part] = outputs.get(part, 0) + f.stat().st_size
+
+    stages = {name: asdict(s) for name, s in e.stage_stats.items()}
+    return {
+        "pages": e.store.doc_get("page_count"),
+        "total": {
+            "wall": wall,
+            # the parent and the pool
+            "cpu": sum(s["cpu"] for s in stages.values()),
+            "pickled_in": sum(s["pickled_in"] for s in stages.values()),
+            "pickled_out": sum(s["pickled_out"] for s in stages.values()),
+            "peak_rss": max((s["peak_rss"] for s in stages.values()), default=0),
+            "output_bytes": sum(outputs.values()),
+        },
+        "stages": stages,
+        "outputs": dict(sorted(outputs.items())),
+    }
+
+
+def merge_min(a: dict, b: dict) -> dict:
+    """
+    the minimum of every metric of two rounds
+    """
+    return {k: merge_min(v, b[k]) if isinstance(v, dict) else min(v, b[k]) for k, v in a.items() if k in b}
+
+
+def run(args):
+    dir_corpus = Path(args.dir_corpus)
+    files = sorted(dir_corpus.glob("*.pdf"))
+    if args.only:
+        files = [f for f in files if f.stem in args.only.split(",")]
+    if args.skip:
+        files = [f for f in files if f.stem not in args.skip.split(",")]
+
+    pinned = {}
+    if (dir_corpus / "corpus.json").exists():
+        pinned = json.loads((dir_corpus / "corpus.json").read_text())["files"]
+    hashes = {f.name: file_sha256(f) for f in files}
+    for name, h in hashes.items():
+        if name in pinned and pinned[name] != h:
+            print(f"warning: {name} differs from corpus.json")
+
+    executor = create_pool(args.jobs)
+    docs: dict[str, dict] = {}
+    try:
+        for f in files:
+            try:
+                for _ in range(args.rounds):
+                    r = measure_doc(f, executor, not args.no_fuse)
+                    docs[f.name] = merge_min(docs[f.name], r) if f.name in docs else r
+            except Exception as e:
+                docs[f.name] = {"error": f"{type(e).__name__}: {e}"}
+                print(f"{f.name} failed: {docs[f.name]['error']}")
+                continue
+            t = docs[f.name]["total"]
+            print(
+                f"{f.name}: {docs[f.name]['pages']} pages, wall = {t['wall']:.2f}s, cpu = {t['cpu']:.2f}s, "
+                f"peak rss = {t['peak_rss'] / 1024:.0f}MB, pickled = {(t['pickled_in'] + t['pickled_out']) / 1024 / 1024:.1f}MB, "
+                f"outputs = {t['output_bytes'] / 1024 / 1024:.1f}MB"
+            )
+    finally:
+        executor.shutdown()
+
+    result = {
+        "meta": {
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "pymupdf": fitz.VersionBind,
+            "jobs": args.jobs,
+            "fuse": not args.no_fuse,
+            "rounds": args.rounds,
+        },
+        "corpus": hashes,
+        "docs": docs,
+    }
+    Path(args.result).write_text(json.dumps(result, indent=4))
+
+
+def compare_metrics(name: str, base: dict, cur: dict, threshold: float) -> tuple[list[str], list[str]]:
+    """
+    regressions and improvements of one document or stage
+    """
+    regressions, improvements = [], []
+    for k, min_diff in MIN_DIFF.items():
+        if k not in base or k not in cur:
+            continue
+        b, c = base[k], cur[k]
+        line = f"{name} {k}: {b:.6g} -> {c:.6g}" + (f" ({(c - b) / b:+.0%})" if b else "")
+        if c - b > min_diff and c > b * (1 + threshold):
+            regressions.append(line)
+        elif b - c > min_diff and c < b * (1 - threshold):
+            improvements.append(line)
+    return regressions, improvements
+
+
+def compare(args):
+    base = json.loads(Path(args.baseline).read_text())
+    cur = json.loads(Path(args.result).read_text())
+    for k in ["pymupdf", "jobs", "fuse"]:
+        if base["meta"].get(k) != cur["meta"].get(k):
+            print(f"warning: {k} differs, {base['meta'].get(k)} / {cur['meta'].get(k)}")
+
+    regressions, improvements = [], []
+    for name, doc in cur["docs"].items():
+        if name not in base["docs"]:
+            print(f"warning: {name} isn't in the baseline")
+            continue
+        if base["corpus"].get(name) != cur["corpus"].get(name):
+            print(f"warning: {name} differs from the baseline pdf")
+        doc_base = base["docs"][name]
+        if "error" in doc or "error" in doc_base:
+            if "error" in doc and "error" not in doc_base:
+                regressions.append(f"{name} failed: {doc['error']}")
+            elif "error" in doc_base and "error" not in doc:
+                improvements.append(f"{name} fixed")
+            continue
+        r, i = compare_metrics(name, doc_base["total"], doc["total"], args.threshold)
+        regressions += r
+        improvements += i
+        for stage, s in doc["stages"].items():
+            if stage in doc_base["stages"]:
+                r, i = compare_metrics(f"{name} [{stage}]", doc_base["stages"][stage], s, args.threshold)
+                regressions += r
+                improvements += i
+
+    for line in improvements:
+        print(f"improved: {line}")
+    for line in regressions:
+        print(f"REGRESSION: {line}")
+    print(f"{len(regressions)} regressions, {len(improvements)} improvements, threshold = {args.threshold:.0%}")
+    sys.exit(1 if regressions else 0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("gen")
+    p.add_argument("dir_corpus")
+
+    p = sub.add_parser("run")
+    p.add_argument("dir_corpus")
+    p.add_argument("result")
+    p.add_argument("--jobs", type=int, default=None, help="processes of the pool, default cpu count")
+    p.add_argument("--rounds", type=int, default=3, help="the minimum of each metric is kept")
+    p.add_argument("--no-fuse", action="store_true")
+    p.add_argument("--only", help="comma separated stems")
+    p.add_argument("--skip", help="comma separated stems")
+
+    p = sub.add_parser("compare")
+    p.add_argument("baseline")
+    p.add_argument("result")
+    p.add_argument("--threshold", type=float, default=0.1)
+
+    args = parser.parse_args()
+    if args.command == "gen":
+        gen(Path(args.dir_corpus))
+    elif args.command == "run":
+        run(args)
+    else:
+        compare(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+check worker/geometry.py against the scalar helpers of worker/common.py, then time both, usage: python bench_geometry.py [rounds]
+"""
+import sys
+import time
+import random
+from typing import Callable
+
+from worker import geometry  # type: ignore
+from worker.common import (  # type: ignore
+    RectIndex,
+    RectRelation,
+    rectangle_relation,
+    get_min_bounding_rect,
+)
+from worker.flow_type import Rectangle  # type: ignore
+
+
+def random_rects(n: int, grid: int) -> list[Rectangle]:
+    """
+    integer corners on a small grid, so that shared edges, equal rects and empty rects are common
+    """
+    rects = []
+    for _ in range(n):
+        x0, x1 = sorted(random.randint(0, grid) for _ in range(2))
+        y0, y1 = sorted(random.randint(0, grid) for _ in range(2))
+        rects.append(Rectangle(x0, y0, x1, y1))
+    return rects
+
+
+def check(rounds: int):
+    for _ in range(rounds):
+        a = random_rects(random.randint(1, 40), random.choice([3, 10, 100]))
+        b = random_rects(random.randint(1, 40), random.choice([3, 10, 100]))
+        arr_a, arr_b = geometry.to_array(a), geometry.to_array(b)
+
+        expected = [[rectangle_relation(r1, r2).value for r2 in b] for r1 in a]
+        if geometry.relation_matrix(arr_a, arr_b).tolist() != expected:
+            raise Exception(f"relation_matrix differs, a = {a}, b = {b}")
+        if geometry.relation(arr_a[0], arr_b).tolist() != expected[0]:
+            raise Exception(f"relation differs, a = {a[0]}, b = {b}")
+        if geometry.intersects(arr_a[0], arr_b).tolist() != [v != 0 for v in expected[0]]:
+            raise Exception(f"intersects differs, a = {a[0]}, b = {b}")
+        for value in range(4):
+            if geometry.relation_mask(arr_a[0], arr_b, value).tolist() != [v == value for v in expected[0]]:
+                raise Exception(f"relation_mask differs, {value}, a = {a[0]}, b = {b}")
+
+        if geometry.bounding_rect(arr_a).tolist() != list(get_min_bounding_rect(a).to_tuple()):
+            raise Exception(f"bounding_rect differs, a = {a}")
+
+        m = min(len(a), len(b))
+        for r1, r2, u, (i, ok) in zip(
+            a,
+            b,
+            geometry.union(arr_a[:m], arr_b[:m]).tolist(),
+            zip(*[v.tolist() for v in geometry.intersection(arr_a[:m], arr_b[:m])]),
+        ):
+            if u != list(get_min_bounding_rect([r1, r2]).to_tuple()):
+                raise Exception(f"union differs, {r1} {r2}")
+            if ok != (rectangle_relation(r1, r2) != RectRelation.NOT_INTERSECT):
+                raise Exception(f"intersection mask differs, {r1} {r2}")
+            if ok and i != [max(r1.x0, r2.x0), max(r1.y0, r2.y0), min(r1.x1, r2.x1), min(r1.y1, r2.y1)]:
+                raise Exception(f"intersection differs, {r1} {r2}")
+
+        # both paths of RectIndex.search
+        index = RectIndex(b, 100, 100)
+        for relation in [None, *RectRelation]:
+            if relation == RectRelation.NOT_INTERSECT:
+                continue
+            for min_vectorized in [0, len(b) + 1]:
+                RectIndex.MIN_VECTORIZED = min_vectorized
+                got = index.search(a[0], relation)
+                want = [
+                    i
+                    for i, r in enumerate(b)
+                    if (rectangle_relation(a[0], r).value == relation.value if relation else expected[0][i] != 0)
+                ]
+                if got != want:
+                    raise Exception(f"RectIndex.search differs, {relation}, a = {a[0]}, b = {b}")
+    RectIndex.MIN_VECTORIZED = 48
+
+
+def timeit(f: Callable, number: int) -> float:
+    start = time.perf_counter()
+    for _ in range(number):
+        f()
+    return (time.perf_counter() - start) / number
+
+
+def bench():
+    print("one rect against n rects, us per call")
+    for n in [8, 32, 128, 1024, 8192]:
+        rects = random_rects(n, 1000)
+        arr = geometry.to_array(rects)
+        q = rects[0]
+        q_arr = arr[0]
+        number = max(10, 20000 // n)
+
+        t_scalar = timeit(lambda: [rectangle_relation(q, r) for r in rects], number)
+        t_vector = timeit(lambda: geometry.relation(q_arr, arr), number)
+        t_mask = timeit(lambda: geometry.relation_mask(q_arr, arr, geometry.INTERSECT), number)
+        t_bbox_scalar = timeit(lambda: get_min_bounding_rect(rects), number)
+        t_bbox_vector = timeit(lambda: geometry.bounding_rect(arr), number)
+        t_convert = timeit(lambda: geometry.to_array(rects), number)
+        print(
+            f"  n = {n:<5} relation {t_scalar * 1e6:8.1f} -> {t_vector * 1e6:6.1f}, mask {t_mask * 1e6:6.1f}, "
+            f"bounding {t_bbox_scalar * 1e6:7.1f} -> {t_bbox_vector * 1e6:5.1f}, to_array {t_convert * 1e6:7.1f}"
+        )
+
+    print("n rects against n rects, ms per call")
+    for n in [32, 256, 1024]:
+        a = random_rects(n, 1000)
+        arr = geometry.to_array(a)
+        t_scalar = timeit(lambda: [[rectangle_relation(r1, r2) for r2 in a] for r1 in a], 3)
+        t_vector = timeit(lambda: geometry.relation_matrix(arr, arr), 3)
+        print(f"  n = {n:<5} relation {t_scalar * 1e3:8.2f} -> {t_vector * 1e3:6.2f}")
+
+
+def main():
+    random.seed(0)
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    check(rounds)
+    print(f"geometry matches the scalar helpers, {rounds} rounds")
+    bench()
+
+
+if __name__ == "__main__":
+    main()
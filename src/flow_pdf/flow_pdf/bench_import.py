@@ -0,0 +1,68 @@
+"""
+time the import of the worker package in fresh interpreters, and check dbscan_1d against sklearn when it is installed, usage: python bench_import.py [rounds]
+"""
+import sys
+import random
+import subprocess
+import statistics
+
+from worker.common import dbscan_1d  # type: ignore
+
+IMPORT_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import worker
+t = time.perf_counter() - start
+print(t, len(sys.modules), int("sklearn" in sys.modules))
+"""
+
+
+def time_import(rounds: int):
+    times = []
+    for _ in range(rounds):
+        out = subprocess.run(
+            [sys.executable, "-c", IMPORT_SCRIPT], capture_output=True, text=True, check=True
+        ).stdout.split()
+        times.append(float(out[0]))
+    print(
+        f"import worker: median {statistics.median(times) * 1e3:.0f}ms, min {min(times) * 1e3:.0f}ms, "
+        f"{out[1]} modules, sklearn loaded = {out[2] == '1'}"
+    )
+
+
+def check_dbscan(rounds: int):
+    try:
+        import numpy as np
+        from sklearn.cluster import DBSCAN
+    except ImportError:
+        print("sklearn is not installed, dbscan_1d not checked")
+        return
+
+    checked = 0
+    for _ in range(rounds):
+        n = random.randint(1, 60)
+        # x0 of text blocks, columns a few points apart and ties
+        centers = [random.uniform(0, 600) for _ in range(random.randint(1, 4))]
+        x0_list = [
+            round(random.choice(centers) + random.choice([0, random.uniform(-12, 12)]), 1) for _ in range(n)
+        ]
+        if any(abs(abs(a - b) - 10) < 1e-6 for a in x0_list for b in x0_list):
+            # sklearn rounds distances of eps either way
+            continue
+        min_samples = random.randint(1, 6)
+        want = DBSCAN(eps=10, min_samples=min_samples).fit(np.array(x0_list).reshape(-1, 1)).labels_.tolist()
+        if dbscan_1d(x0_list, 10, min_samples) != want:
+            raise Exception(f"dbscan_1d differs, x0_list = {x0_list}, min_samples = {min_samples}")
+        checked += 1
+    print(f"dbscan_1d matches sklearn, {checked} of {rounds} rounds without a distance of eps")
+
+
+def main():
+    random.seed(0)
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    time_import(rounds)
+    check_dbscan(rounds * 1000)
+
+
+if __name__ == "__main__":
+    main()
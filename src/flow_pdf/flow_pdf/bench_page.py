@@ -0,0 +1,136 @@
+"""
+compare the page models, usage: python bench_page.py <file.pdf> [<file.pdf> ...]
+"""
+import sys
+import time
+import pickle
+import tracemalloc
+import concurrent.futures
+import multiprocessing
+from pathlib import Path
+from typing import Callable
+
+import fitz
+
+from worker.flow_type import init_mpage_from_mupdf  # type: ignore
+from worker.compact_page import init_compact_page_from_mupdf, CompactPage  # type: ignore
+
+INITS = {
+    "MPage": init_mpage_from_mupdf,
+    "CompactPage": init_compact_page_from_mupdf,
+}
+
+
+def count_objects(page) -> int:
+    """
+    Python objects kept by the page, bbox / origin / dir included
+    """
+    if isinstance(page, CompactPage):
+        # the page, 4 arrays, the font table and its strings
+        return 6 + len(page.fonts)
+
+    n = 1
+    for block in page.blocks:
+        n += 2
+        for line in getattr(block, "lines", []):
+            n += 3
+            for span in line.spans:
+                n += 3 + 3 * len(span.chars)
+    return n
+
+
+def get_peak_rss() -> int:
+    """
+    VmHWM in KiB, unlike ru_maxrss it is not inherited from the parent across fork + exec
+    """
+    for line in Path("/proc/self/status").read_text().splitlines():
+        if line.startswith("VmHWM:"):
+            return int(line.split()[1])
+    raise Exception("VmHWM not found")
+
+
+def measure_rss(name: str, f: str) -> tuple[float, int]:
+    """
+    run in a fresh process, returns (peak RSS growth in KiB per page, objects per page)
+    """
+    init = INITS[name]
+    with fitz.open(f) as doc:  # type: ignore
+        # warm up, so that imports and MuPDF buffers are not counted
+        init(doc[0].get_text("rawdict"))  # type: ignore
+
+        rss_before = get_peak_rss()
+        # one rawdict alive at a time, like ReadDocWorker
+        pages = [init(page.get_text("rawdict")) for page in doc]  # type: ignore
+        rss_after = get_peak_rss()
+
+    objects = sum(count_objects(p) for p in pages)
+    return (rss_after - rss_before) / len(pages), objects // len(pages)
+
+
+def measure(init: Callable, raw_dicts: list[dict]) -> dict:
+    tracemalloc.start()
+    start = time.perf_counter()
+    pages = [init(raw_dict) for raw_dict in raw_dicts]
+    t_init = time.perf_counter() - start
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    data = [pickle.dumps(p) for p in pages]
+    t_dump = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for d in data:
+        pickle.loads(d)
+    t_load = time.perf_counter() - start
+
+    # what a worker pays to walk the text after unpickling
+    start = time.perf_counter()
+    for d in data:
+        for block in pickle.loads(d).get_text_blocks():
+            for line in block.lines:
+                for span in line.spans:
+                    len(span.chars)
+    t_walk = time.perf_counter() - start
+
+    return {
+        "init": t_init,
+        "memory": memory,
+        "pickle": sum(len(d) for d in data),
+        "dump": t_dump,
+        "load": t_load,
+        "load+walk": t_walk,
+    }
+
+
+def main():
+    for f in sys.argv[1:]:
+        with fitz.open(f) as doc:  # type: ignore
+            raw_dicts = [page.get_text("rawdict") for page in doc]  # type: ignore
+
+        print(f"{Path(f).name}, {len(raw_dicts)} pages")
+        for name, init in INITS.items():
+            r = measure(init, raw_dicts)
+            print(
+                f"  {name:<12} init {r['init']:.3f}s, memory {r['memory'] / 1024 / 1024:.1f}MiB, "
+                f"pickle {r['pickle'] / 1024 / 1024:.1f}MiB, dump {r['dump']:.3f}s, "
+                f"load {r['load']:.3f}s, load+walk {r['load+walk']:.3f}s"
+            )
+
+            # time without tracemalloc, and peak RSS of a clean process
+            start = time.perf_counter()
+            for raw_dict in raw_dicts:
+                init(raw_dict)
+            t_page = (time.perf_counter() - start) / len(raw_dicts)
+
+            with concurrent.futures.ProcessPoolExecutor(
+                1, mp_context=multiprocessing.get_context("spawn")
+            ) as executor:
+                rss, objects = executor.submit(measure_rss, name, f).result()
+            print(
+                f"  {'':<12} per page: init {t_page * 1000:.2f}ms, {objects} objects, peak RSS +{rss:.0f}KiB"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+compare RectIndex with a linear scan on the rects of each page, usage: python bench_rect_index.py <file.pdf> [<file.pdf> ...]
+
+queries are the text blocks of the page and a grid of shot sized rects, like ShotWorker and BigBlockWorker
+"""
+import sys
+import time
+from pathlib import Path
+
+import fitz
+
+from worker.common import RectIndex, rectangle_relation, RectRelation  # type: ignore
+from worker.flow_type import Rectangle  # type: ignore
+
+
+def get_queries(page, width: float, height: float) -> list[Rectangle]:
+    queries = [Rectangle(*b[:4]) for b in page.get_text("blocks")]  # type: ignore
+    for i in range(4):
+        for j in range(8):
+            queries.append(
+                Rectangle(
+                    width * i / 4, height * j / 8, width * (i + 1) / 4, height * (j + 1) / 8
+                )
+            )
+    return queries
+
+
+def scan(rects: list, queries: list[Rectangle]) -> list[list[int]]:
+    return [
+        [
+            i
+            for i, r in enumerate(rects)
+            if rectangle_relation(q, r) != RectRelation.NOT_INTERSECT
+        ]
+        for q in queries
+    ]
+
+
+def search(rects: list, queries: list[Rectangle], width: float, height: float) -> list[list[int]]:
+    index = RectIndex(rects, width, height)
+    return [index.search(q) for q in queries]
+
+
+def main():
+    for f in sys.argv[1:]:
+        t_scan = 0.0
+        t_index = 0.0
+        max_rects = 0
+        with fitz.open(f) as doc:  # type: ignore
+            for page in doc:
+                width, height = page.mediabox_size
+                rects = [Rectangle(*b[:4]) for b in page.get_text("blocks")]  # type: ignore
+                rects.extend(d["rect"] for d in page.get_drawings())
+                max_rects = max(max_rects, len(rects))
+                queries = get_queries(page, width, height)
+
+                start = time.perf_counter()
+                r_scan = scan(rects, queries)
+                t_scan += time.perf_counter() - start
+
+                start = time.perf_counter()
+                r_index = search(rects, queries, width, height)
+                t_index += time.perf_counter() - start
+
+                if r_scan != r_index:
+                    raise Exception(f"page[{page.number}] results differ")
+
+            print(
+                f"{Path(f).name}, {doc.page_count} pages, up to {max_rects} rects per page: "
+                f"scan {t_scan:.3f}s, index (build + search) {t_index:.3f}s, {t_scan / t_index:.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
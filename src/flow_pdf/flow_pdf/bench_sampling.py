@@ -0,0 +1,78 @@
+"""
+compare the document statistics estimated from a page sample with a full scan, usage: python bench_sampling.py <sample_pages> [<file.pdf or name> ...]
+
+a name of bench_corpus.CORPUS is generated, without files the documents of SAMPLING_CORPUS are used.
+on formula_dense the halves of a sample of 8 pages agreed on one of its two columns.
+"""
+import sys
+import time
+import tempfile
+from pathlib import Path
+
+import bench_corpus  # type: ignore
+from worker import (  # type: ignore
+    Executer,
+    ExecuterConfig,
+    ReadDocWorker,
+    FontCounterWorker,
+    WidthCounterWorker,
+)
+
+SAMPLING_CORPUS = ["double_column", "triple_column", "formula_dense"]
+
+STATS = [
+    "most_common_font",
+    "common_size_range",
+    "big_text_width_range",
+    "big_text_columns",
+    "big_text_line_height_range",
+]
+
+
+def get_stats(file_input: Path, sample_pages) -> tuple[dict, float, str]:
+    """
+    returns the statistics, the time of the statistics workers and the sampling log lines
+    """
+    with tempfile.TemporaryDirectory() as d:
+        e = Executer(
+            file_input,
+            Path(d),
+            ExecuterConfig("bench", False, fuse_pages=True, sample_pages=sample_pages),
+        )
+        e.register([ReadDocWorker, FontCounterWorker, WidthCounterWorker])
+        start = time.perf_counter()
+        e.execute()
+        t = time.perf_counter() - start
+
+        log = (Path(d) / "log.txt").read_text()
+        sampled = "; ".join(
+            line.split("] ", 1)[1] for line in log.splitlines() if " sampled " in line
+        )
+        return {k: e.store.doc_get(k) for k in STATS}, t, sampled
+
+
+def compare_files(sample_pages: int, files: list[Path]):
+    for f in files:
+        full, t_full, _ = get_stats(Path(f), None)
+        sampled, t_sampled, log = get_stats(Path(f), sample_pages)
+        print(f"{Path(f).name}: full {t_full:.2f}s, sampled {t_sampled:.2f}s, {log or 'no sampling'}")
+        for k in STATS:
+            mark = "  " if full[k] == sampled[k] else "!="
+            print(f"  {mark} {k}: {full[k]} / {sampled[k]}")
+
+
+def main():
+    sample_pages = int(sys.argv[1])
+    with tempfile.TemporaryDirectory() as d:
+        files = []
+        for arg in sys.argv[2:] or SAMPLING_CORPUS:
+            if arg in bench_corpus.CORPUS and not Path(arg).exists():
+                files.append(Path(d) / f"{arg}.pdf")
+                bench_corpus.gen_doc(arg, files[-1])
+            else:
+                files.append(Path(arg))
+        compare_files(sample_pages, files)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+GET throughput of the files of a task on a running backend, usage: python bench_static.py <url> <task_id> [concurrency] [seconds]
+
+each connection is kept alive and fetches index.html and the shots listed in output/manifest.json, in three modes:
+identity, gzip/br accepted, and revalidation with If-None-Match
+"""
+import sys
+import json
+import time
+import http.client
+import threading
+from urllib.parse import urlsplit
+
+MODES = {
+    "identity": {},
+    "compressed": {"Accept-Encoding": "br, gzip"},
+    "revalidate": {},
+}
+
+
+def get(conn: http.client.HTTPConnection, path: str, headers: dict) -> tuple[int, int, str]:
+    """
+    status, body bytes and etag
+    """
+    conn.request("GET", path, headers=headers)
+    resp = conn.getresponse()
+    body = resp.read()
+    return resp.status, len(body), resp.getheader("etag") or ""
+
+
+def run(host: str, port: int, paths: list[str], headers: dict, revalidate: bool, concurrency: int, seconds: float):
+    etags: dict[str, str] = {}
+    if revalidate:
+        conn = http.client.HTTPConnection(host, port)
+        for p in paths:
+            etags[p] = get(conn, p, headers)[2]
+        conn.close()
+
+    lock = threading.Lock()
+    totals = {"requests": 0, "bytes": 0, "errors": 0}
+    deadline = time.perf_counter() + seconds
+
+    def worker(k: int):
+        conn = http.client.HTTPConnection(host, port)
+        requests = body_bytes = errors = 0
+        i = k
+        while time.perf_counter() < deadline:
+            p = paths[i % len(paths)]
+            i += 1
+            h = dict(headers)
+            if revalidate:
+                h["If-None-Match"] = etags[p]
+            status, n, _ = get(conn, p, h)
+            requests += 1
+            body_bytes += n
+            errors += status not in (200, 304)
+        conn.close()
+        with lock:
+            totals["requests"] += requests
+            totals["bytes"] += body_bytes
+            totals["errors"] += errors
+
+    threads = [threading.Thread(target=worker, args=(k,)) for k in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return totals["requests"] / elapsed, totals["bytes"] / elapsed, totals["errors"]
+
+
+def main():
+    url, task_id = sys.argv[1], sys.argv[2]
+    concurrency = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+    seconds = float(sys.argv[4]) if len(sys.argv) > 4 else 5
+
+    u = urlsplit(url)
+    if u.hostname is None:
+        sys.exit(f"no host in {url}\n{__doc__}")
+    host, port = u.hostname, u.port or 80
+    prefix = f"/static/{task_id}/output/"
+    conn = http.client.HTTPConnection(host, port)
+    conn.request("GET", prefix + "manifest.json")
+    manifest = json.loads(conn.getresponse().read())
+    conn.close()
+    paths = [prefix + "index.html"] + [prefix + f for f in manifest["files"] if f.startswith("assets/")]
+
+    for mode, headers in MODES.items():
+        rps, bps, errors = run(host, port, paths, headers, mode == "revalidate", concurrency, seconds)
+        print(
+            f"{mode:<10} {len(paths)} files, concurrency = {concurrency}: {rps:.0f} req/s, "
+            f"{bps / 1024 / 1024:.1f}MB/s, errors = {errors}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+concurrent uploads to a running backend, usage: python bench_upload.py <url> <file.pdf> [concurrency] [requests] [--unique]
+
+--unique appends a comment to each pdf, so that every request hashes to a new task instead of the existing one
+"""
+import sys
+import time
+import uuid
+import statistics
+import http.client
+import concurrent.futures
+from pathlib import Path
+from urllib.parse import urlsplit
+
+
+def make_body(content: bytes, boundary: str) -> bytes:
+    return (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="f"; filename="bench.pdf"\r\n'
+        f"Content-Type: application/pdf\r\n\r\n"
+    ).encode() + content + f"\r\n--{boundary}--\r\n".encode()
+
+
+def upload(host: str, port: int, content: bytes) -> tuple[int, float]:
+    """
+    returns the status code and the latency
+    """
+    boundary = uuid.uuid4().hex
+    body = make_body(content, boundary)
+    start = time.perf_counter()
+    conn = http.client.HTTPConnection(host, port, timeout=600)
+    try:
+        conn.request(
+            "POST",
+            "/api/task",
+            body,
+            {"Content-Type": f"multipart/form-data; boundary={boundary}"},
+        )
+        resp = conn.getresponse()
+        resp.read()
+        return resp.status, time.perf_counter() - start
+    finally:
+        conn.close()
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    unique = "--unique" in sys.argv
+    u = urlsplit(args[0])
+    if u.hostname is None:
+        sys.exit(f"no host in {args[0]}\n{__doc__}")
+    host, port = u.hostname, u.port or 80
+    content = Path(args[1]).read_bytes()
+    concurrency = int(args[2]) if len(args) > 2 else 8
+    requests = int(args[3]) if len(args) > 3 else 64
+
+    def run(i: int) -> tuple[int, float]:
+        if unique:
+            return upload(host, port, content + f"\n% bench {uuid.uuid4().hex}\n".encode())
+        return upload(host, port, content)
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(run, range(requests)))
+    t = time.perf_counter() - start
+
+    latencies = sorted(r[1] for r in results)
+    codes: dict[int, int] = {}
+    for code, _ in results:
+        codes[code] = codes.get(code, 0) + 1
+    print(
+        f"{requests} uploads of {len(content) / 1024 / 1024:.1f}MB, concurrency = {concurrency}: "
+        f"{requests / t:.1f} req/s, {requests * len(content) / t / 1024 / 1024:.1f}MB/s, "
+        f"latency median = {statistics.median(latencies) * 1e3:.0f}ms, "
+        f"p95 = {latencies[int(len(latencies) * 0.95) - 1] * 1e3:.0f}ms, max = {latencies[-1] * 1e3:.0f}ms, "
+        f"status = {codes}"
+    )
+
+
+if __name__ == "__main__":
+    main()
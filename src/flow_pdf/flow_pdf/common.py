@@ -1,5 +1,10 @@
 import logging
-from htutil import file
+import time
+import importlib
+import json
+import os
+import threading
+from dataclasses import asdict
 from pathlib import Path
 
 
@@ -36,8 +41,60 @@ def create_file_logger(file_output: Path):
     return logger
 
 
+def import_modules(modules: list[str]) -> dict[str, float]:
+    """
+    import modules in order, returns the seconds each one took, a module already imported by an earlier one takes ~0
+    """
+    times = {}
+    for m in modules:
+        start = time.perf_counter()
+        importlib.import_module(m)
+        times[m] = time.perf_counter() - start
+    return times
+
+
+def write_json_atomic(file_output: Path, content):
+    """
+    same format as htutil write_json, readers polling the file never see it half written
+    """
+    file_output.parent.mkdir(parents=True, exist_ok=True)
+    file_tmp = file_output.with_name(f".{file_output.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    file_tmp.write_text(json.dumps(content, indent=4, ensure_ascii=False), encoding="utf-8")
+    os.replace(file_tmp, file_output)
+
+
+class RateLimiter:
+    """
+    ready is True at most once per interval seconds
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.last = float("-inf")
+
+    def ready(self) -> bool:
+        now = time.monotonic()
+        if now - self.last < self.interval:
+            return False
+        self.last = now
+        return True
+
+
+def progress_to_json(progress) -> dict:
+    """
+    worker.Progress for task.json, times in seconds rounded to 0.1
+    """
+    js = asdict(progress)
+    for k, v in js.items():
+        if isinstance(v, float):
+            js[k] = round(v, 1)
+    js["stage_times"] = {k: round(v, 2) for k, v in js["stage_times"].items()}
+    return js
+
+
+# htutil is not imported here, so that the entry points can check the version with the standard library only
 file_git = Path(__file__).parent.parent / "git.txt"
 if file_git.exists():
-    version = file.read_text(file_git)
+    version = file_git.read_text(encoding="utf-8", errors="ignore")
 else:
     version = 'dev'
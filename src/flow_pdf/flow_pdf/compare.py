@@ -0,0 +1,294 @@
+"""
+regression compare of the outputs of main.py against the accepted targets, which script/cp2target.py copies to
+<target>/<stem>/big_blocks_id/big_blocks_id.json, <target>/<stem>/doc/doc.json and <target>/<stem>/shot_rects/<page>.json
+
+usage: python compare.py <dir_output> <dir_target> [dir_report], exits with 1 when a document changed
+"""
+import os
+import sys
+import json
+import html
+import time
+import concurrent.futures
+from collections import Counter
+from pathlib import Path
+from typing import Optional
+
+# added and removed elements kept in the report for each document
+ELEMENT_SAMPLES = 5
+# shot rects are compared at this precision, so that float noise isn't reported
+RECT_DIGITS = 2
+
+
+def read_if_changed(file_cur: Path, file_expect: Path) -> Optional[tuple]:
+    """
+    both files parsed, None when they are byte for byte equal, most are, and it's checked without parsing them
+    """
+    cur = file_cur.read_bytes() if file_cur.exists() else b"[]"
+    expect = file_expect.read_bytes() if file_expect.exists() else b"[]"
+    if cur == expect:
+        return None
+    return json.loads(cur), json.loads(expect)
+
+
+def diff_values(cur: list, expect: list) -> Optional[dict]:
+    """
+    values only in cur (added) and only in expect (removed), None when the lists are equal
+    """
+    if cur == expect:
+        return None
+    set_c, set_e = set(cur), set(expect)
+    return {"added": sorted(set_c - set_e), "removed": sorted(set_e - set_c)}
+
+
+def diff_pages(cur: list[list], expect: list[list]) -> list[dict]:
+    """
+    pages whose list differs
+    """
+    pages = []
+    for i in range(max(len(cur), len(expect))):
+        diff = diff_values(cur[i] if i < len(cur) else [], expect[i] if i < len(expect) else [])
+        if diff is not None:
+            pages.append({"page": i, **diff})
+    return pages
+
+
+def rect_keys(shot_rects: list) -> list[tuple]:
+    """
+    (column, x0, y0, x1, y1) of every rect of a page, shot_rects is column -> shots -> rects
+    """
+    return [
+        (column, *(round(r[k], RECT_DIGITS) for k in ("x0", "y0", "x1", "y1")))
+        for column, shots in enumerate(shot_rects)
+        for shot in shots
+        for r in shot
+    ]
+
+
+def diff_shot_rects(dir_cur: Path, dir_expect: Path) -> list[dict]:
+    """
+    pages whose shot rects differ, a page file missing on one side has no rects
+    """
+    names = {f.name for f in dir_cur.glob("*.json")} | {f.name for f in dir_expect.glob("*.json")}
+    pages = []
+    for name in sorted(names, key=lambda n: int(Path(n).stem)):
+        parsed = read_if_changed(dir_cur / name, dir_expect / name)
+        if parsed is None:
+            continue
+        diff = diff_values(rect_keys(parsed[0]), rect_keys(parsed[1]))
+        if diff is not None:
+            pages.append({"page": int(Path(name).stem), **diff})
+    return pages
+
+
+def element_key(element: dict) -> str:
+    return json.dumps(element, sort_keys=True, ensure_ascii=False)
+
+
+def element_summary(element: dict) -> str:
+    """
+    type and the beginning of the text of an element
+    """
+    texts = [c.get("text", "") for c in element.get("children", [])] or [element.get("text", "")]
+    text = " ".join(texts).strip()
+    return f"{element.get('type')}: {text[:80]}" if text else f"{element.get('type')}: {element.get('path', '')}"
+
+
+def diff_elements(cur: list[dict], expect: list[dict]) -> dict:
+    """
+    elements only in cur or only in expect, counted as multisets, and whether the order of the others changed
+    """
+    if cur == expect:
+        return {
+            "elements_added": 0,
+            "elements_removed": 0,
+            "elements_reordered": False,
+            "added_samples": [],
+            "removed_samples": [],
+        }
+    # only the part between the common prefix and suffix is keyed, a change is usually local
+    start = 0
+    while start < min(len(cur), len(expect)) and cur[start] == expect[start]:
+        start += 1
+    end = 0
+    while end < min(len(cur), len(expect)) - start and cur[-1 - end] == expect[-1 - end]:
+        end += 1
+    keys_c = [element_key(e) for e in cur[start : len(cur) - end]]
+    keys_e = [element_key(e) for e in expect[start : len(expect) - end]]
+    counter_c, counter_e = Counter(keys_c), Counter(keys_e)
+    added = counter_c - counter_e
+    removed = counter_e - counter_c
+    common = counter_c & counter_e
+
+    def in_common(keys: list[str]) -> list[str]:
+        left = Counter(common)
+        kept = []
+        for k in keys:
+            if left[k] > 0:
+                left[k] -= 1
+                kept.append(k)
+        return kept
+
+    return {
+        "elements_added": sum(added.values()),
+        "elements_removed": sum(removed.values()),
+        "elements_reordered": in_common(keys_c) != in_common(keys_e),
+        "added_samples": [element_summary(json.loads(k)) for k in list(added)[:ELEMENT_SAMPLES]],
+        "removed_samples": [element_summary(json.loads(k)) for k in list(removed)[:ELEMENT_SAMPLES]],
+    }
+
+
+def compare_doc(dir_output: Path, dir_target: Path) -> dict:
+    """
+    diff of one document, parts without a target are listed in missing and skipped.
+    a document with a target and no output changed
+    """
+    result: dict = {"name": dir_output.name, "missing": [], "changed": False}
+    if not dir_output.is_dir():
+        return {**result, "changed": True, "error": f"no output: {dir_output}"}
+
+    file_t = dir_target / "big_blocks_id" / "big_blocks_id.json"
+    if file_t.exists():
+        parsed = read_if_changed(dir_output / "big_blocks_id.json", file_t)
+        pages = diff_pages(*parsed) if parsed is not None else []
+        result["pages"] = pages
+        result["blocks_added"] = sum(len(p["added"]) for p in pages)
+        result["blocks_removed"] = sum(len(p["removed"]) for p in pages)
+        result["changed"] |= bool(pages)
+    else:
+        result["missing"].append(str(file_t))
+
+    file_t = dir_target / "doc" / "doc.json"
+    if file_t.exists():
+        parsed = read_if_changed(dir_output / "output" / "doc.json", file_t)
+        elements = (parsed[0]["elements"], parsed[1]["elements"]) if parsed is not None else ([], [])
+        diff = diff_elements(*elements)
+        result.update(diff)
+        result["changed"] |= bool(diff["elements_added"] or diff["elements_removed"] or diff["elements_reordered"])
+    else:
+        result["missing"].append(str(file_t))
+
+    dir_t = dir_target / "shot_rects"
+    if dir_t.exists():
+        pages = diff_shot_rects(dir_output / "shot_rects", dir_t)
+        result["shot_pages"] = pages
+        result["changed"] |= bool(pages)
+    else:
+        result["missing"].append(str(dir_t))
+
+    return result
+
+
+def compare_doc_safe(pair: tuple[Path, Path]) -> dict:
+    try:
+        return compare_doc(*pair)
+    except Exception as e:
+        return {"name": pair[0].name, "missing": [], "changed": True, "error": f"{type(e).__name__}: {e}"}
+
+
+def compare_corpus(pairs: list[tuple[Path, Path]], max_workers: Optional[int] = None) -> dict:
+    """
+    pairs: output directory and target directory of each document, compared in max_workers processes
+    """
+    t = time.perf_counter()
+    pairs = sorted(pairs)
+    workers = max_workers or os.cpu_count() or 1
+    if workers == 1 or len(pairs) < 2:
+        docs = [compare_doc_safe(p) for p in pairs]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            docs = list(executor.map(compare_doc_safe, pairs, chunksize=max(1, len(pairs) // (workers * 4))))
+
+    changed = [d for d in docs if d["changed"]]
+    return {
+        "docs": len(docs),
+        "changed": len(changed),
+        "pages": sum(len(d.get("pages", [])) for d in changed),
+        "blocks_added": sum(d.get("blocks_added", 0) for d in changed),
+        "blocks_removed": sum(d.get("blocks_removed", 0) for d in changed),
+        "elements_added": sum(d.get("elements_added", 0) for d in changed),
+        "elements_removed": sum(d.get("elements_removed", 0) for d in changed),
+        "shot_pages": sum(len(d.get("shot_pages", [])) for d in changed),
+        "missing": [m for d in docs for m in d["missing"]],
+        "time": time.perf_counter() - t,
+        "changed_docs": changed,
+    }
+
+
+def render_html(summary: dict) -> str:
+    e = html.escape
+    rows = []
+    for d in summary["changed_docs"]:
+        details = []
+        if "error" in d:
+            details.append(f"<p>error: {e(d['error'])}</p>")
+        for p in d.get("pages", []):
+            details.append(f"<li>blocks, page {p['page']}: added {e(str(p['added']))}, removed {e(str(p['removed']))}</li>")
+        for p in d.get("shot_pages", []):
+            details.append(f"<li>shots, page {p['page']}: added {e(str(p['added']))}, removed {e(str(p['removed']))}</li>")
+        for s in d.get("added_samples", []):
+            details.append(f"<li>element added: {e(s)}</li>")
+        for s in d.get("removed_samples", []):
+            details.append(f"<li>element removed: {e(s)}</li>")
+        if d.get("elements_reordered"):
+            details.append("<li>elements reordered</li>")
+        rows.append(
+            f"<tr><td><details><summary>{e(d['name'])}</summary><ul>{''.join(details)}</ul></details></td>"
+            f"<td>{len(d.get('pages', []))}</td><td>{d.get('blocks_added', 0)}</td><td>{d.get('blocks_removed', 0)}</td>"
+            f"<td>{d.get('elements_added', 0)}</td><td>{d.get('elements_removed', 0)}</td>"
+            f"<td>{len(d.get('shot_pages', []))}</td></tr>"
+        )
+    missing = "".join(f"<li>{e(m)}</li>" for m in summary["missing"])
+    return f"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>flow-pdf compare</title>
+<style>
+body {{ font-family: sans-serif; }}
+table {{ border-collapse: collapse; }}
+td, th {{ border: 1px solid #ccc; padding: 4px 8px; vertical-align: top; }}
+</style>
+</head>
+<body>
+<h1>{summary['changed']} of {summary['docs']} documents changed</h1>
+<p>pages = {summary['pages']}, blocks added = {summary['blocks_added']}, removed = {summary['blocks_removed']},
+elements added = {summary['elements_added']}, removed = {summary['elements_removed']}, shot pages = {summary['shot_pages']}</p>
+<table>
+<tr><th>document</th><th>pages</th><th>blocks added</th><th>blocks removed</th><th>elements added</th><th>elements removed</th><th>shot pages</th></tr>
+{''.join(rows)}
+</table>
+<details><summary>{len(summary['missing'])} targets not found</summary><ul>{missing}</ul></details>
+</body>
+</html>
+"""
+
+
+def write_report(summary: dict, dir_report: Path):
+    """
+    compare.json and compare.html
+    """
+    (dir_report / "compare.json").write_text(json.dumps(summary, indent=4, ensure_ascii=False), encoding="utf-8")
+    (dir_report / "compare.html").write_text(render_html(summary), encoding="utf-8")
+
+
+def main():
+    dir_output, dir_target = Path(sys.argv[1]), Path(sys.argv[2])
+    dir_report = Path(sys.argv[3]) if len(sys.argv) > 3 else dir_output
+
+    # a document only in the target failed or was not run, it counts as changed
+    names = {d.name for d in dir_output.iterdir() if d.is_dir()} | {d.name for d in dir_target.iterdir() if d.is_dir()}
+    pairs = [(dir_output / name, dir_target / name) for name in names]
+    summary = compare_corpus(pairs)
+    write_report(summary, dir_report)
+    print(
+        f"{summary['changed']} of {summary['docs']} documents changed, pages = {summary['pages']}, "
+        f"blocks added = {summary['blocks_added']}, removed = {summary['blocks_removed']}, "
+        f"elements added = {summary['elements_added']}, removed = {summary['elements_removed']}, "
+        f"time = {summary['time']:.2f}s, report: {dir_report / 'compare.html'}"
+    )
+    sys.exit(1 if summary["changed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,27 @@
+# only the standard library is imported before the version check, fitz, numpy, PIL, bs4 and the workers
+# are imported once an event needs processing, see HEAVY_MODULES
 import os
 import json
-from common import version, create_main_logger
-from worker import Executer, ExecuterConfig, workers_prod  # type: ignore
+import time
+from common import version, create_main_logger, import_modules, write_json_atomic, RateLimiter, progress_to_json
 from pathlib import Path
-from htutil import file
 import shutil
 import traceback
+from typing import Any
 
+HEAVY_MODULES = ["fitz", "numpy", "PIL.Image", "bs4", "worker"]
+
+# documents of the event batch processed at once. their pages share one pool, so this fills the pool
+# while a document waits at a stage barrier, it doesn't add processes
+env_doc_workers = os.getenv("FLOW_PDF_DOC_WORKERS")
+doc_workers = int(env_doc_workers) if env_doc_workers else 4
+# processes of the page pool, empty means cpu count
+env_max_workers = os.getenv("FLOW_PDF_MAX_WORKERS")
+max_workers = int(env_max_workers) if env_max_workers else None
+# seconds between progress writes of a task.json
+PROGRESS_INTERVAL = 1.0
+
+start_time = time.perf_counter()
 logger = create_main_logger()
 if version == "dev":
     logger.warning("dev mode, version is not set")
@@ -72,46 +87,115 @@ dir_output = dir_data / "output"
 dir_input.mkdir(parents=True, exist_ok=True)
 dir_output.mkdir(parents=True, exist_ok=True)
 
+
+def read_doc_version(file_doc: Path):
+    """
+    flow-pdf-version of an existing doc.json, or None
+    """
+    if not file_doc.exists():
+        return None
+    with open(file_doc, "r", encoding="utf-8") as f:
+        return json.load(f)["meta"]["flow-pdf-version"]
+
+
+stems: list[str] = []
 for event in events:
     file_k: str = event["oss"]["object"]["key"]
     stem = Path(file_k).stem
+    if stem in stems:
+        continue
 
-    file_task = dir_output / stem / "task.json"
-    file_doc = dir_output / stem / "output" / "doc.json"
-
-    if file_doc.exists():
+    doc_version = read_doc_version(dir_output / stem / "output" / "doc.json")
+    if doc_version is not None:
         logger.info(f"file_doc exists")
-        doc = file.read_json(file_doc)
-        if doc["meta"]["flow-pdf-version"] == version:
+        if doc_version == version:
             logger.info(f"file_doc version is same, skip")
             continue
         else:
-            logger.info(f'clean old version {doc["meta"]["flow-pdf-version"]}')
+            logger.info(f"clean old version {doc_version}")
             shutil.rmtree(dir_output / stem)
+    stems.append(stem)
+
+if len(stems) == 0:
+    logger.info(f"nothing to do, time = {time.perf_counter() - start_time:.2f}s")
+    exit(0)
+
+import_times = import_modules(HEAVY_MODULES)
+logger.info(
+    "import time: "
+    + ", ".join(f"{m} = {t:.2f}s" for m, t in import_times.items())
+    + f", total = {sum(import_times.values()):.2f}s"
+)
 
+from worker import Executer, ExecuterConfig, Progress, workers_prod, get_shared_pool  # type: ignore
+import concurrent.futures
+
+
+def process(stem: str) -> tuple[str, float]:
+    """
+    run one document, an error only fails its own task.json. returns the status and the latency
+    """
+    start = time.perf_counter()
+    file_task = dir_output / stem / "task.json"
     file_input = dir_input / f"{stem}.pdf"
 
     logger.info(f"start {file_input.name}")
 
-    file.write_json(file_task, {"status": "executing"})
+    write_json_atomic(file_task, {"status": "executing"})
 
-    cfg = ExecuterConfig(version, False)  # type: ignore
-    e = Executer(file_input, dir_output / stem, cfg)
-    e.register(workers_prod)
+    limiter = RateLimiter(PROGRESS_INTERVAL)
+
+    def on_progress(progress: Progress):
+        if limiter.ready():
+            write_json_atomic(file_task, {"status": "executing", "progress": progress_to_json(progress)})
+
+    progress = None
     try:
-        e.execute()
-        file.write_json(file_task, {"status": "done"})
-        logger.info(f"{file_input.name} success")
-    except Exception as e:
-        file.write_json(
+        cfg = ExecuterConfig(version, False, max_workers, fuse_pages=True)  # type: ignore
+        executer = Executer(
+            file_input, dir_output / stem, cfg, get_shared_pool(max_workers), on_progress=on_progress
+        )
+        progress = executer.progress
+        executer.register(workers_prod)
+        executer.execute()
+        write_json_atomic(
             file_task,
             {
-                "status": "error",
-                "error": str(e),
+                "status": "done",
+                "time": round(time.perf_counter() - start, 2),
+                "stage_times": progress_to_json(progress)["stage_times"],
             },
         )
+        status = "done"
+        logger.info(f"{file_input.name} success")
+    except Exception as e:
+        js: dict[str, Any] = {
+            "status": "error",
+            "error": str(e),
+        }
+        if progress is not None:
+            js["progress"] = progress_to_json(progress)
+        write_json_atomic(file_task, js)
+        status = "error"
 
         logger.error(f"{file_input.name} error")
         traceback.print_exc()
 
-    logger.info(f"end {file_input.name}")
+    t = time.perf_counter() - start
+    logger.info(f"end {file_input.name}, time = {t:.2f}s")
+    return status, t
+
+
+# started before the threads, so that they don't race to create it
+get_shared_pool(max_workers)
+
+with concurrent.futures.ThreadPoolExecutor(min(doc_workers, len(stems))) as doc_executor:
+    results = list(doc_executor.map(process, stems))
+
+latencies = sorted(t for _, t in results)
+logger.info(
+    f"events = {len(events)}, run = {len(stems)}, "
+    f"error = {sum(status == 'error' for status, _ in results)}, "
+    f"latency median = {latencies[len(latencies) // 2]:.2f}s, max = {latencies[-1]:.2f}s, "
+    f"total time = {time.perf_counter() - start_time:.2f}s"
+)
@@ -3,17 +3,40 @@ from pathlib import Path
 import shutil
 import time
 from htutil import file
-from worker import Executer, ExecuterConfig, workers_dev  # type: ignore
+from worker import Executer, ExecuterConfig, workers_dev, get_shared_pool  # type: ignore
+from worker.cache import DEFAULT_CACHE_DIR, file_hash  # type: ignore
+from worker.common import get_source_hash  # type: ignore
+from worker.shot_encoder import WebpOptions  # type: ignore
 import concurrent.futures
 import common  # type: ignore
+import compare  # type: ignore
 import traceback
 from tqdm import tqdm
 import os
+import argparse
+from typing import Optional
+from dataclasses import asdict
 
 from common import version
 
 cfg = yaml.load(Path("./config.yaml").read_text(), Loader=yaml.FullLoader)
 disable_pbar = not cfg["processbar"]["enabled"]
+max_workers = (cfg.get("pool") or {}).get("max_workers")
+doc_workers = (cfg.get("pool") or {}).get("doc_workers") or 4
+fuse_pages = bool((cfg.get("pool") or {}).get("fuse_pages"))
+sample_pages = (cfg.get("stats") or {}).get("sample_pages")
+
+cfg_cache = cfg.get("cache") or {}
+cache_enabled = bool(cfg_cache.get("enabled"))
+cache_dir = Path(cfg_cache["path"]) if cfg_cache.get("path") else DEFAULT_CACHE_DIR
+cache_max_size = (
+    cfg_cache["max_size_mb"] * 1024 * 1024 if cfg_cache.get("max_size_mb") else None
+)
+
+cfg_shot = cfg.get("shot") or {}
+webp = WebpOptions(
+    **{k: cfg_shot[k] for k in ("quality", "method", "lossless") if cfg_shot.get(k) is not None}
+)
 
 dir_data = Path(cfg["files"]["path"])
 
@@ -60,32 +83,175 @@ def get_files_from_cfg() -> list[tuple[Path, Path]]:
 
 logger = common.create_file_logger(get_log_path(dir_output))
 
-
-def create_task(file_input: Path, dir_output: Path):
+# what the outputs of a document were made from, written after it succeeds, see get_run_state
+RUN_FILE = "run.json"
+# files of a document directory that aren't outputs
+NOT_OUTPUTS = {RUN_FILE, "log.txt", "error.txt"}
+
+
+def get_run_state(file_input: Path) -> dict:
+    return {
+        "input_hash": file_hash(file_input),
+        "version": version,
+        "config": {"sample_pages": sample_pages, "webp": asdict(webp)},
+        "workers": {W.__name__: get_source_hash(W) for W in workers_dev},
+    }
+
+
+def get_output_hashes(dir_out: Path) -> dict[str, str]:
+    """
+    sha256 of the files written by the workers, the links to the input of flow_pdf_view are left out
+    """
+    return {
+        f.relative_to(dir_out).as_posix(): file_hash(f)
+        for f in sorted(dir_out.rglob("*"))
+        if f.is_file() and not f.is_symlink() and f.relative_to(dir_out).as_posix() not in NOT_OUTPUTS
+    }
+
+
+def get_changes(dir_out: Path, state: dict) -> list[str]:
+    """
+    why the document has to run again, empty when its outputs are up to date
+    """
+    file_run = dir_out / RUN_FILE
+    if not file_run.exists():
+        return ["no previous run"]
+    previous = file.read_json(file_run)
+
+    changes = [k for k in ["input_hash", "version", "config"] if previous.get(k) != state[k]]
+    workers = previous.get("workers", {})
+    changes += [W for W, h in state["workers"].items() if workers.get(W) != h]
+    if not changes and previous.get("outputs") != get_output_hashes(dir_out):
+        changes.append("outputs")
+    return changes
+
+
+def create_task(
+    file_input: Path,
+    dir_output: Path,
+    jobs: Optional[int],
+    run_state: Optional[dict] = None,
+) -> int:
+    """
+    returns the page count, 0 when the document failed.
+    jobs: processes of the shared pool, which is fetched for every document, a broken one is replaced
+    run_state: written to RUN_FILE with the output hashes on success, runs with the cache enabled
+    """
     logger.info(f"start {file_input.name}")
     t = time.perf_counter()
     # if dir_output.exists():
     #     shutil.rmtree(dir_output)
     # dir_output.mkdir(parents=True)
 
-    cfg = ExecuterConfig(version, False)  # type: ignore
-    e = Executer(file_input, dir_output, cfg)
-    e.register(workers_dev)
+    cfg = ExecuterConfig(
+        version,  # type: ignore
+        cache_enabled or run_state is not None,
+        max_workers,
+        fuse_pages=fuse_pages,
+        cache_dir=cache_dir,
+        cache_max_size=cache_max_size,
+        webp=webp,
+        sample_pages=sample_pages,
+    )
+    page_count = 0
     try:
+        doc_hash = run_state["input_hash"] if run_state is not None else None
+        e = Executer(file_input, dir_output, cfg, get_shared_pool(jobs), doc_hash)
+        e.register(workers_dev)
         e.execute()
-    except Exception as e:
+        page_count = e.store.doc_get("page_count")
+        if run_state is not None:
+            file.write_json(
+                dir_output / RUN_FILE,
+                {**run_state, "outputs": get_output_hashes(dir_output)},
+            )
+    except Exception:
         logger.error(f"{file_input.name} failed, time = {time.perf_counter() - t:.2f}s")
         file.write_text(dir_output / "error.txt", traceback.format_exc())
     logger.info(f"end {file_input.name}, time = {time.perf_counter() - t:.2f}s")
+    return page_count
+
+
+def run_batch(
+    files: list[tuple[Path, Path]],
+    jobs: Optional[int],
+    run_states: Optional[dict[Path, dict]] = None,
+):
+    """
+    doc_workers documents at once, all of their pages go to one pool of jobs processes.
+    an idle process takes the next page of any document, so a document waiting at a stage barrier
+    doesn't leave cores idle. the largest files start first, so that no big one is left alone at the end
+    """
+    files = sorted(files, key=lambda f: f[0].stat().st_size, reverse=True)
+    executor = get_shared_pool(jobs)
+
+    start = time.perf_counter()
+    pages = 0
+    failed = 0
+    with tqdm(total=len(files), disable=disable_pbar) as progress:
+        with concurrent.futures.ThreadPoolExecutor(doc_workers) as doc_executor:
+            futures = [
+                doc_executor.submit(
+                    create_task,
+                    file_input,
+                    dir_output,
+                    jobs,
+                    run_states[file_input] if run_states is not None else None,
+                )
+                for file_input, dir_output in files
+            ]
+            for future in concurrent.futures.as_completed(futures):
+                page_count = future.result()
+                pages += page_count
+                failed += page_count == 0
+                progress.update(1)
+    t = time.perf_counter() - start
+
+    msg = (
+        f"corpus: docs = {len(files)}, failed = {failed}, pages = {pages}, time = {t:.2f}s, "
+        f"{pages / t:.2f} pages/s, {len(files) / t * 60:.2f} docs/min, "
+        f"jobs = {getattr(executor, '_max_workers', jobs)}, doc workers = {doc_workers}"
+    )
+    logger.info(msg)
+    print(msg)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--jobs", type=int, default=max_workers, help="processes of the page pool, default pool.max_workers of config.yaml or cpu count"
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help=f"keep the outputs of documents whose input, version, config and workers are the same as in their {RUN_FILE}, "
+        "run the others with the cache enabled, so that only the changed workers and the ones after them run",
+    )
+    args = parser.parse_args()
+
     files = list(get_files_from_cfg())
 
+    files_run = files
+    # document name -> why it runs again
+    changed: dict[str, list[str]] = {}
+    run_states: Optional[dict[Path, dict]] = None
+    if args.incremental:
+        run_states = {}
+        files_run = []
+        for file_input, dir_out in files:
+            run_states[file_input] = get_run_state(file_input)
+            changes = get_changes(dir_out, run_states[file_input])
+            if changes:
+                files_run.append((file_input, dir_out))
+                changed[file_input.name] = changes
+
+    kept = {d.name for _, d in files} - {d.name for _, d in files_run}
     if dir_output.exists():
         for d in dir_output.glob("*"):
             if not d.is_file():
-                shutil.rmtree(d)
+                # the directories of up to date documents are kept
+                if d.name not in kept:
+                    shutil.rmtree(d)
             elif d.name == "log.txt":
                 file.write_text(d, "")
             else:
@@ -98,16 +264,15 @@ if __name__ == "__main__":
     dir_view.mkdir(parents=True)
 
     for file_input, dir_out in files:
-        dir_out.mkdir(parents=True)
+        dir_out.mkdir(parents=True, exist_ok=True)
         dir_dest = dir_view / dir_out.name
         # dir_dest.mkdir(parents=True)
         os.symlink(str(dir_out.absolute()), str(dir_dest.absolute()))
 
-        os.symlink(str(file_input.absolute()), str(dir_dest / file_input.name))
-        os.symlink(
-            str(get_meta_path(file_input).absolute()),
-            str(dir_dest / get_meta_path(file_input).name),
-        )
+        # kept from the previous run for documents that are up to date
+        for f in [file_input, get_meta_path(file_input)]:
+            if not (dir_dest / f.name).is_symlink():
+                os.symlink(str(f.absolute()), str(dir_dest / f.name))
 
     os.symlink(
         str(get_log_path(dir_output).absolute()),
@@ -115,45 +280,35 @@ if __name__ == "__main__":
     )
 
     logger.info(f"version: {version}")
+    if args.incremental:
+        for name, changes in changed.items():
+            logger.info(f"{name} changed: {', '.join(changes)}")
+        logger.info(f"incremental: {len(files) - len(files_run)} of {len(files)} documents up to date")
+        print(f"incremental: {len(files) - len(files_run)} of {len(files)} documents up to date")
 
-    with tqdm(total=len(files), disable=disable_pbar) as progress:
-        with concurrent.futures.ProcessPoolExecutor(max_workers=12) as executor:
-            futures = [
-                executor.submit(create_task, file_input, dir_output)
-                for file_input, dir_output in files
-            ]
-            for future in concurrent.futures.as_completed(futures):
-                # future.result()
-                progress.update(1)
+    run_batch(files_run, args.jobs, run_states)
 
     if cfg["compare"]["enabled"]:
         dir_target = Path(cfg["compare"]["target"])
-
-        dir_output_list = []
-        for _, d in files:
-            dir_output_list.append(d)
-        dir_output_list.sort()
-
-        for dir_output in dir_output_list:
-            dir_t = dir_target / dir_output.stem
-            file_t = dir_t / "big_blocks_id" / "big_blocks_id.json"
-            if not file_t.exists():
-                logger.warning(f"target file not found: {file_t}")
-                continue
-
-            cur = file.read_json(dir_output / "big_blocks_id.json")
-            expect = file.read_json(file_t)
-
-            if cur != expect:
-                logger.debug(f"{dir_output.stem} changed")
-                for i in range(len(cur)):
-                    if cur[i] != expect[i]:
-                        add_list = []
-                        del_list = []
-                        for j in range(len(cur[i])):
-                            if cur[i][j] not in expect[i]:
-                                add_list.append(cur[i][j])
-                        for j in range(len(expect[i])):
-                            if expect[i][j] not in cur[i]:
-                                del_list.append(expect[i][j])
-                        logger.debug(f"page {i}, add: {add_list}, del: {del_list}")
+        summary = compare.compare_corpus([(d, dir_target / d.stem) for _, d in files], args.jobs)
+        compare.write_report(summary, dir_output)
+
+        for m in summary["missing"]:
+            logger.warning(f"target file not found: {m}")
+        for d in summary["changed_docs"]:
+            logger.debug(f"{d['name']} changed")
+            if "error" in d:
+                logger.debug(f"error: {d['error']}")
+            for p in d.get("pages", []):
+                logger.debug(f"page {p['page']}, add: {p['added']}, del: {p['removed']}")
+            if d.get("elements_added") or d.get("elements_removed") or d.get("elements_reordered"):
+                logger.debug(
+                    f"elements add: {d['elements_added']}, del: {d['elements_removed']}, "
+                    f"reordered: {d['elements_reordered']}"
+                )
+            for p in d.get("shot_pages", []):
+                logger.debug(f"shots page {p['page']}, add: {p['added']}, del: {p['removed']}")
+        logger.info(
+            f"compare: {summary['changed']} of {summary['docs']} documents changed, "
+            f"time = {summary['time']:.2f}s, report: {dir_output / 'compare.html'}"
+        )
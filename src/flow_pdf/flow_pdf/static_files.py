@@ -0,0 +1,181 @@
+import json
+import os
+import re
+import mimetypes
+from pathlib import Path
+from typing import Optional
+
+import anyio
+from starlette.staticfiles import StaticFiles
+from starlette.responses import Response, StreamingResponse
+from starlette.types import Scope
+from starlette.datastructures import Headers
+
+# shots keep their name when a new version rebuilds the task, so they are immutable for a day only
+ASSET_CACHE_CONTROL = "public, max-age=86400, immutable"
+# html and everything else in output/ is revalidated with its ETag
+OUTPUT_CACHE_CONTROL = "no-cache"
+
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+CHUNK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)")
+
+
+def parse_range(value: str, size: int) -> Optional[tuple[int, int]]:
+    """
+    start and end (inclusive) of a single "bytes=" range, None when it isn't satisfiable.
+    raises ValueError for multiple ranges or other units, the whole file is sent then
+    """
+    m = RANGE_RE.fullmatch(value.strip())
+    if m is None:
+        raise ValueError(value)
+    start, end = m.groups()
+    if start == "":
+        if end == "" or int(end) == 0:
+            return None
+        return max(size - int(end), 0), size - 1
+    if int(start) >= size:
+        return None
+    return int(start), min(int(end), size - 1) if end else size - 1
+
+
+def parse_accept_encoding(value: str) -> dict[str, float]:
+    """
+    coding -> q-value of an Accept-Encoding header, a q-value that isn't a number counts as 0
+    """
+    accepted = {}
+    for item in value.split(","):
+        coding, *params = [p.strip() for p in item.split(";")]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, v = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(v)
+                except ValueError:
+                    q = 0.0
+        accepted[coding.lower()] = q
+    return accepted
+
+
+def choose_encoding(accept_encoding: str, available) -> Optional[str]:
+    """
+    the available encoding with the highest q-value, ties go to the order of ENCODING_SUFFIXES.
+    None when none is acceptable, q=0 means not acceptable, * stands for the codings not listed
+    """
+    accepted = parse_accept_encoding(accept_encoding)
+    best, best_q = None, 0.0
+    for e in ENCODING_SUFFIXES:
+        q = accepted.get(e, accepted.get("*", 0.0))
+        if e in available and q > best_q:
+            best, best_q = e, q
+    return best
+
+
+def read_range(file: Path, start: int, end: int):
+    with open(file, "rb") as f:
+        f.seek(start)
+        left = end - start + 1
+        while left > 0:
+            chunk = f.read(min(CHUNK_SIZE, left))
+            if not chunk:
+                break
+            left -= len(chunk)
+            yield chunk
+
+
+class OutputFiles(StaticFiles):
+    """
+    serves the task directories, files listed in output/manifest.json of a task (see ManifestWorker)
+    get strong ETags, Cache-Control, their precompressed variant when the client accepts it, and Range requests
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # manifest file -> (mtime_ns, files)
+        self.manifests: dict[Path, tuple[int, dict]] = {}
+
+    def get_manifest_entry(self, path: str) -> Optional[tuple[Path, dict]]:
+        """
+        file and manifest entry of a request path like <task_id>/output/assets/page_0_shot_0.webp
+        """
+        parts = Path(path).parts
+        if len(parts) < 3 or parts[1] != "output":
+            return None
+        full_path, stat_result = self.lookup_path(path)
+        if stat_result is None:
+            return None
+
+        file_manifest = Path(self.directory) / parts[0] / "output" / "manifest.json"  # type: ignore
+        try:
+            mtime = file_manifest.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+        cached = self.manifests.get(file_manifest)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, json.loads(file_manifest.read_text())["files"])
+            self.manifests[file_manifest] = cached
+
+        entry = cached[1].get("/".join(parts[2:]))
+        if entry is None:
+            return None
+        return Path(full_path), entry
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        found = None
+        if scope["method"] in ("GET", "HEAD"):
+            found = await anyio.to_thread.run_sync(self.get_manifest_entry, path)
+        if found is None:
+            return await super().get_response(path, scope)
+        file, entry = found
+
+        request_headers = Headers(scope=scope)
+        headers = {
+            "cache-control": ASSET_CACHE_CONTROL if Path(path).parts[2] == "assets" else OUTPUT_CACHE_CONTROL,
+            "accept-ranges": "bytes",
+        }
+        media_type = mimetypes.guess_type(file.name)[0] or "text/plain"
+
+        encodings = entry.get("encodings", {})
+        if encodings:
+            headers["vary"] = "Accept-Encoding"
+            e = choose_encoding(request_headers.get("accept-encoding", ""), encodings)
+            if e is not None:
+                file = Path(f"{file}{ENCODING_SUFFIXES[e]}")
+                entry = encodings[e]
+                headers["content-encoding"] = e
+
+        etag = f'"{entry["etag"]}"'
+        headers["etag"] = etag
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+            if etag in tags or "*" in tags:
+                return Response(status_code=304, headers=headers)
+
+        size = entry["size"]
+        range_header = request_headers.get("range")
+        if range_header is not None and request_headers.get("if-range", etag) == etag:
+            try:
+                r = parse_range(range_header, size)
+            except ValueError:
+                pass
+            else:
+                if r is None:
+                    headers["content-range"] = f"bytes */{size}"
+                    return Response(status_code=416, headers=headers)
+                start, end = r
+                headers["content-range"] = f"bytes {start}-{end}/{size}"
+                headers["content-length"] = str(end - start + 1)
+                if scope["method"] == "HEAD":
+                    return Response(status_code=206, headers=headers, media_type=media_type)
+                return StreamingResponse(
+                    read_range(file, start, end), status_code=206, headers=headers, media_type=media_type
+                )
+
+        # file_response handles HEAD on every starlette version, its mtime based ETag is replaced
+        response = self.file_response(str(file), os.stat(file), scope)
+        response.headers.update(headers)
+        return response
@@ -0,0 +1,116 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+
+class TaskQueue:
+    """
+    fifo of task ids in a sqlite file, so that pending and executing tasks survive restarts.
+
+    status is pending, executing, done or error. pop blocks until a task is pending.
+    """
+
+    def __init__(self, file_db: Path, max_size: int):
+        """
+        max_size: pending tasks at most, push fails above it
+        """
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.db = sqlite3.connect(file_db, check_same_thread=False, isolation_level=None)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, created REAL NOT NULL, "
+            "started REAL, finished REAL, error TEXT)"
+        )
+
+    def get_status(self, task_id: str) -> Optional[str]:
+        with self.lock:
+            row = self.db.execute("SELECT status FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        return row[0] if row else None
+
+    def push(self, task_id: str) -> bool:
+        """
+        returns whether the task is queued now, False when the queue is full.
+        a pending or executing task is left as it is, a done or error one is pending again
+        """
+        with self.lock:
+            row = self.db.execute("SELECT status FROM tasks WHERE id = ?", (task_id,)).fetchone()
+            if row and row[0] in ("pending", "executing"):
+                return True
+            (size,) = self.db.execute("SELECT COUNT(*) FROM tasks WHERE status = 'pending'").fetchone()
+            if size >= self.max_size:
+                return False
+            self.db.execute(
+                "INSERT INTO tasks (id, status, created) VALUES (?, 'pending', ?) "
+                "ON CONFLICT(id) DO UPDATE SET status = 'pending', created = excluded.created, "
+                "started = NULL, finished = NULL, error = NULL "
+                "WHERE tasks.status IN ('done', 'error')",
+                (task_id, time.time()),
+            )
+            self.changed.notify()
+        return True
+
+    def pop(self) -> str:
+        """
+        oldest pending task, marked as executing
+        """
+        with self.lock:
+            while True:
+                row = self.db.execute(
+                    "SELECT id FROM tasks WHERE status = 'pending' ORDER BY created LIMIT 1"
+                ).fetchone()
+                if row:
+                    break
+                self.changed.wait()
+            self.db.execute(
+                "UPDATE tasks SET status = 'executing', started = ? WHERE id = ?",
+                (time.time(), row[0]),
+            )
+        return row[0]
+
+    def finish(self, task_id: str, error: Optional[str] = None):
+        with self.lock:
+            self.db.execute(
+                "UPDATE tasks SET status = ?, finished = ?, error = ? WHERE id = ?",
+                ("error" if error is not None else "done", time.time(), error, task_id),
+            )
+
+    def requeue_executing(self) -> list[str]:
+        """
+        tasks interrupted by a restart run again, ahead of the tasks pushed later
+        """
+        with self.lock:
+            ids = [
+                row[0]
+                for row in self.db.execute("SELECT id FROM tasks WHERE status = 'executing'")
+            ]
+            self.db.execute("UPDATE tasks SET status = 'pending', started = NULL WHERE status = 'executing'")
+            self.changed.notify_all()
+        return ids
+
+    def pending(self) -> list[str]:
+        """
+        pending task ids, in queue order
+        """
+        with self.lock:
+            return [
+                row[0]
+                for row in self.db.execute(
+                    "SELECT id FROM tasks WHERE status = 'pending' ORDER BY created"
+                )
+            ]
+
+    def mean_duration(self, n: int = 20) -> Optional[float]:
+        """
+        mean time of the last n finished tasks, None before the first one
+        """
+        with self.lock:
+            (t,) = self.db.execute(
+                "SELECT AVG(finished - started) FROM ("
+                "SELECT finished, started FROM tasks WHERE status = 'done' ORDER BY finished DESC LIMIT ?)",
+                (n,),
+            ).fetchone()
+        return t
@@ -1,4 +1,4 @@
-from .common import Worker, Executer, ExecuterConfig
+from .common import Worker, Executer, ExecuterConfig, Progress, StageStats, create_pool, get_shared_pool
 
 from .read_doc import ReadDocWorker
 from .pre_dump import PreDumpWorker
@@ -11,6 +11,7 @@ from .shot import ShotWorker
 from .json_gen import JSONGenWorker
 from .markdown_gen import MarkdownGenWorker
 from .html_gen import HTMLGenWorker
+from .manifest import ManifestWorker
 
 workers_prod = [
     ReadDocWorker,
@@ -21,6 +22,7 @@ workers_prod = [
     ShotWorker,
     JSONGenWorker,
     HTMLGenWorker,
+    ManifestWorker,
 ]
 
 workers_dev = workers_prod.copy()
@@ -1,10 +1,10 @@
 from .common import (
     Worker,
     is_common_span,
-    rectangle_relation,
     RectRelation,
+    RectIndex,
     get_min_bounding_rect,
-    frequent_sub_array,
+    frequent_window,
 )
 from .common import (
     DocInputParams,
@@ -25,8 +25,8 @@ from .flow_type import (
     Point,
 )
 
-import concurrent.futures
 from dataclasses import dataclass
+from collections import Counter
 
 
 @dataclass
@@ -60,6 +60,8 @@ class PageOutParams(PageOutputParams):
 
 
 class BigBlockWorker(Worker):
+    reads_pdf = False
+
     def run(  # type: ignore[override]
         self, doc_in: DocInParams, page_in: list[PageInParams]
     ) -> tuple[DocOutParams, list[PageOutParams]]:
@@ -78,19 +80,7 @@ class BigBlockWorker(Worker):
     def run_page_parallel(
         self, doc_in: DocInParams, page_in: list[PageInParams], try_times: int
     ) -> list[PageOutParams]:
-        page_out = []
-
-        with concurrent.futures.ProcessPoolExecutor() as executor:
-            futures = [
-                executor.submit(
-                    self.run_page, page_index, doc_in, page_in[page_index], try_times
-                )
-                for page_index in range(doc_in.page_count)
-            ]
-            for future in futures:
-                p_out = future.result()
-                page_out.append(p_out)
-            return page_out
+        return self.map_pages(self.run_page, doc_in, page_in, try_times)
 
     def run_page(  # type: ignore[override]
         self,
@@ -139,6 +129,11 @@ class BigBlockWorker(Worker):
         for b in page_in.page_info.get_text_blocks():
             bbox_list.append(b.bbox)
 
+        width, height = page_in.page_info.width, page_in.page_info.height
+        # the first len(drawings) rects of bbox_list are the drawings
+        bbox_index = RectIndex(bbox_list, width, height)
+        drawings_count = len(page_in.drawings)
+
         def is_big_block(block: MTextBlock):
             def is_in_width_range(block: MTextBlock):
                 return (
@@ -169,9 +164,11 @@ class BigBlockWorker(Worker):
 
             def is_not_be_contained(block: MTextBlock):
                 # deep_root 0
-                for drawing in page_in.drawings:
+                for i in bbox_index.search(block.bbox, RectRelation.CONTAINED_BY):
+                    if i >= drawings_count:
+                        break
                     if try_times >= 2:
-                        r = drawing["rect"]
+                        r = page_in.drawings[i]["rect"]
                         if (
                             r.x1 - r.x0 >= page_in.page_info.width * 0.5
                             and r.y1 - r.y0 >= page_in.page_info.height * 0.5
@@ -179,11 +176,7 @@ class BigBlockWorker(Worker):
                             # like Bigtable A distributed storage system for structu
                             # big drawing cover all block
                             continue
-                    if (
-                        rectangle_relation(block.bbox, drawing["rect"])
-                        == RectRelation.CONTAINED_BY
-                    ):
-                        return False
+                    return False
                 return True
 
             def is_enough_lower(block: MTextBlock):
@@ -219,15 +212,7 @@ class BigBlockWorker(Worker):
                 if block.bbox.height() >= doc_in.big_text_line_height_range.max * 3.5:
                     return True
 
-                counter = 0
-
-                for b in bbox_list:
-                    if rectangle_relation(block.bbox, b) != RectRelation.NOT_INTERSECT:
-                        counter += 1
-                        if counter >= 2:
-                            return False
-
-                return True
+                return len(bbox_index.search(block.bbox)) < 2
 
             judgers = [
                 (is_in_width_range, False),
@@ -369,17 +354,15 @@ class BigBlockWorker(Worker):
             new_column_blocks: list[MTextBlock] = []
             for j, b in enumerate(column_blocks):
                 MIN_DELTA = 5.0
-                deltas = []
-                for line in b.lines:
-                    deltas.append(b.bbox.x1 - line.bbox.x1)
-                sub_d = frequent_sub_array(deltas, 2)
+                deltas = Counter(b.bbox.x1 - line.bbox.x1 for line in b.lines)
+                _, delta_max, delta_count = frequent_window(deltas, 2)
 
                 RIGHT_DISTANCE_THRESHOLD = 0.5
-                radio = len(sub_d) / len(deltas)
+                radio = delta_count / len(b.lines)
                 if radio > RIGHT_DISTANCE_THRESHOLD:
-                    MIN_DELTA += sub_d[-1]
+                    MIN_DELTA += delta_max
 
-                # self.logger.debug(f'page[{page_index}] column[{i}] j[{j}] radio: {radio}, MIN_DELTA: {MIN_DELTA}, deltas: {deltas}, sub_d: {sub_d}')
+                # self.logger.debug(f'page[{page_index}] column[{i}] j[{j}] radio: {radio}, MIN_DELTA: {MIN_DELTA}, deltas: {deltas}')
 
                 p_lines_list: list[list[MLine]] = [[]]
                 for j in range(len(b.lines)):
@@ -0,0 +1,126 @@
+from pathlib import Path
+from typing import Optional
+from dataclasses import fields, is_dataclass
+import hashlib
+import os
+import pickle
+import tempfile
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = Path("/tmp") / "flow-pdf" / "cache"
+
+
+def file_hash(file_input: Path) -> str:
+    h = hashlib.sha256()
+    with open(file_input, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def update_hash(h, obj):
+    """
+    feed obj into h by value. pickle bytes can't be used as key, they depend on which equal objects are shared
+    """
+    if obj is None or isinstance(obj, (bool, int, float, str, bytes)):
+        h.update(repr(obj).encode())
+    elif isinstance(obj, np.ndarray):
+        h.update(f"ndarray{obj.dtype.str}{obj.shape}".encode())
+        h.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, (list, tuple)):
+        h.update(f"{type(obj).__name__}[{len(obj)}".encode())
+        for v in obj:
+            update_hash(h, v)
+        h.update(b"]")
+    elif isinstance(obj, dict):
+        h.update(f"dict[{len(obj)}".encode())
+        for k, v in obj.items():
+            update_hash(h, k)
+            update_hash(h, v)
+        h.update(b"]")
+    elif isinstance(obj, type):
+        h.update(f"{obj.__module__}.{obj.__qualname__}".encode())
+    elif is_dataclass(obj):
+        h.update(type(obj).__name__.encode())
+        update_hash(h, [getattr(obj, f.name) for f in fields(obj)])
+    else:
+        h.update(type(obj).__name__.encode())
+        state = obj.__reduce_ex__(pickle.HIGHEST_PROTOCOL)
+        # (callable, args, state, ...), slotted classes give state as (None, slots)
+        update_hash(h, list(state[1:3]) if len(state) > 1 else repr(obj))
+
+
+class WorkerCache:
+    """
+    content addressed store of worker results, one pickle per key under dir_root.
+
+    entries are written atomically and a hit refreshes the entry's mtime, evict drops the least recently used ones.
+    """
+
+    def __init__(self, dir_root: Path):
+        self.dir_root = dir_root
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_path(self, key: str) -> Path:
+        return self.dir_root / key[:2] / f"{key}.pkl"
+
+    def load(self, key: str):
+        """
+        returns None on miss. an entry that can't be read or unpickled is a miss and is deleted,
+        e.g. one truncated by a full disk, pickled with another version of a class, or evicted meanwhile
+        """
+        file_pkl = self.get_path(key)
+        try:
+            data = file_pkl.read_bytes()
+            value = pickle.loads(data)
+            os.utime(file_pkl)
+        except Exception:
+            self.misses += 1
+            try:
+                file_pkl.unlink(missing_ok=True)
+            except OSError:
+                pass
+            return None
+
+        self.hits += 1
+        return value
+
+    def save(self, key: str, value):
+        file_pkl = self.get_path(key)
+        file_pkl.parent.mkdir(parents=True, exist_ok=True)
+
+        # readers never see a partial file, even with several processes writing the same key
+        fd, file_tmp = tempfile.mkstemp(dir=file_pkl.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(file_tmp, file_pkl)
+        except BaseException:
+            Path(file_tmp).unlink(missing_ok=True)
+            raise
+
+    def evict(self, max_size: int):
+        """
+        scans the whole cache, call it once in a while rather than after each save
+        """
+        entries = []
+        total = 0
+        for file_pkl in self.dir_root.glob("*/*.pkl"):
+            try:
+                st = file_pkl.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, file_pkl))
+            total += st.st_size
+
+        entries.sort(key=lambda e: e[0])
+        for _, size, file_pkl in entries:
+            if total <= max_size:
+                break
+            file_pkl.unlink(missing_ok=True)
+            total -= size
+            self.evictions += 1
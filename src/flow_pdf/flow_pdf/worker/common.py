@@ -1,15 +1,29 @@
 from pathlib import Path
 import inspect
+import sys
+import hashlib
 import time
+import os
+import pickle
+import importlib
+import functools
+import threading
+import weakref
+from collections import OrderedDict
 import fitz
 import concurrent.futures
-from dataclasses import dataclass, fields, asdict
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field, fields
 import fitz.utils
-from htutil import file
 import logging
 from enum import Enum
+from typing import Callable, Optional, Sequence
 from fitz import Page  # type: ignore
-from .flow_type import Rectangle, Range, MSpan
+from .flow_type import Rectangle, Range, MSpan, init_rectangle_unchecked
+from .cache import WorkerCache, DEFAULT_CACHE_DIR, file_hash, update_hash
+from .shot_encoder import WebpOptions
+from . import geometry
+import numpy as np
 
 fitz.TOOLS.set_small_glyph_heights(True)
 
@@ -45,6 +59,41 @@ class Worker:
     logger: logging.Logger
     version: str
     cache_enabled: bool
+    cache: Optional[WorkerCache]
+    doc_hash: str  # sha256 of the pdf
+    executor: concurrent.futures.Executor
+    webp: WebpOptions  # encoding of shot images
+    # outputs read by the workers after this one, not set means all of them
+    used_outputs: set[str]
+
+    # results depend on the content of doc_in.file_input, not only on the declared inputs
+    reads_pdf = True
+
+    def __init__(self) -> None:
+        # called with (pages done, pages) while map_pages runs, cached pages count as done
+        self.on_page_done: Optional[Callable[[int, int], None]] = None
+        # the stage's StageStats, see ExecuterConfig.measure
+        self.stats: Optional[StageStats] = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # the pool can't be pickled, and a child forked before this document
+        # started has no handler for its logger yet
+        state.pop("executor", None)
+        state.pop("on_page_done", None)
+        state.pop("stats", None)
+        if "logger" in state:
+            state["logger"] = (self.logger.name, get_log_file(self.logger))
+        return state
+
+    def __setstate__(self, state):
+        # the callbacks and stats stay in the parent
+        self.on_page_done = None
+        self.stats = None
+        if "logger" in state:
+            name, file_log = state["logger"]
+            state["logger"] = get_worker_logger(name, file_log)
+        self.__dict__.update(state)
 
     def post_run(
         self, doc_in: DocInputParams, page_in: list[PageInputParams]
@@ -71,32 +120,170 @@ class Worker:
     ) -> tuple[DocOutputParams, list[PageOutputParams]]:
         return (DocOutputParams(), [])
 
+    def is_cache_enabled(self) -> bool:
+        return (
+            self.cache_enabled
+            and self.__dict__.get("cache") is not None
+            and not self.__dict__.get("disable_cache")
+        )
+
+    def is_output_used(self, name: str) -> bool:
+        used_outputs = self.__dict__.get("used_outputs")
+        return used_outputs is None or name in used_outputs
+
+    def doc_cache_hash(self, doc_in: DocInputParams) -> "hashlib._Hash":
+        """
+        sha256 of the pdf content (when the worker reads it), the worker source and the doc inputs,
+        paths are left out so renamed or re-uploaded files still hit
+        """
+        h = hashlib.sha256()
+        if self.reads_pdf:
+            h.update(self.doc_hash.encode())
+        h.update(self.version.encode())
+        h.update(get_source_hash(self.__class__).encode())
+        doc_params = {
+            f.name: getattr(doc_in, f.name)
+            for f in fields(doc_in)
+            if f.name not in ("file_input", "dir_output")
+        }
+        update_hash(h, doc_params)
+        return h
+
+    def cache_key(
+        self, doc_in: DocInputParams, page_in: list[PageInputParams]
+    ) -> str:
+        h = self.doc_cache_hash(doc_in)
+        update_hash(h, page_in)
+        return h.hexdigest()
+
+    def page_cache_key(
+        self, doc_key: str, fn: Callable, page_index: int, page_in, args: tuple
+    ) -> str:
+        """
+        doc_key: hexdigest of doc_cache_hash, only this page's inputs are added to it
+        """
+        h = hashlib.sha256(doc_key.encode())
+        update_hash(h, [fn.__name__, page_index, page_in, list(args)])
+        return h.hexdigest()
+
     def load_cache(
         self, doc_in: DocInputParams, page_in: list[PageInputParams]
     ) -> tuple[bool, tuple[DocOutputParams, list[PageOutputParams]]]:
-        if not self.cache_enabled or self.__dict__.get("disable_cache"):
-            return False, (DocOutputParams(), [])
-
-        file_pkl = (
-            Path("/tmp")
-            / "flow-pdf"
-            / "cache"
-            / doc_in.file_input.name
-            / f"{self.__class__.__name__}.pkl"
-        )
-        if not file_pkl.exists():
+        if not self.is_cache_enabled():
             return False, (DocOutputParams(), [])
 
-        d = file.read_pkl(file_pkl)
-        if (
-            d["src"] != inspect.getsource(self.__class__)
-            or d["doc_in"] != doc_in
-            or d["page_in"] != page_in
-        ):
+        d = self.cache.load(self.cache_key(doc_in, page_in))  # type: ignore
+        if d is None:
             return False, (DocOutputParams(), [])
 
         return True, (d["doc_out"], d["page_out"])
 
+    def map_pages(
+        self,
+        fn: Callable,
+        doc_in: DocInputParams,
+        page_in: list,
+        *args,
+        pages: Optional[list[int]] = None,
+    ) -> list:
+        """
+        run fn(page_index, doc_in, page_in[page_index], *args) for every page on the shared pool, results are in page order.
+        pages: only run these pages, the results of the others are None
+
+        with the cache enabled every page is cached on its own, only pages whose inputs changed run again.
+        a failing page doesn't stop the others, their results are cached before the error is raised.
+        """
+        results: list = [None] * doc_in.page_count
+        if pages is None:
+            pages = list(range(doc_in.page_count))
+        page_total = len(pages)
+
+        keys: dict[int, str] = {}
+        if self.is_cache_enabled():
+            doc_key = self.doc_cache_hash(doc_in).hexdigest()
+            for i in pages:
+                keys[i] = self.page_cache_key(doc_key, fn, i, page_in[i], args)
+                results[i] = self.cache.load(keys[i])  # type: ignore
+            pages = [i for i in pages if results[i] is None]
+            self.logger.debug(
+                f"{self.__class__.__name__} {page_total - len(pages)} pages [cached]"
+            )
+
+        on_page_done = self.on_page_done
+        pages_done = page_total - len(pages)
+        if on_page_done is not None:
+            on_page_done(pages_done, page_total)
+
+        stats = self.stats
+        call = measured_call if stats is not None else timed_call
+
+        start = time.perf_counter()
+        error: Optional[Exception] = None
+        work_time = 0.0
+        max_page_time = 0.0
+        retried = False
+        while pages:
+            futures = {}
+            # pages whose process died, or that were submitted to a broken pool
+            lost: list[int] = []
+            for page_index in pages:
+                task = (fn, page_index, doc_in, page_in[page_index], *args)
+                if stats is not None:
+                    stats.pickled_in += len(pickle.dumps(task, pickle.HIGHEST_PROTOCOL))
+                try:
+                    futures[self.executor.submit(call, *task)] = page_index
+                except BrokenProcessPool:
+                    lost.append(page_index)
+
+            for future in concurrent.futures.as_completed(futures):
+                page_index = futures[future]
+                try:
+                    t, result, *measured = future.result()
+                except BrokenProcessPool:
+                    lost.append(page_index)
+                    continue
+                except Exception as e:
+                    self.logger.error(
+                        f"{self.__class__.__name__} page[{page_index}] error: {e}"
+                    )
+                    error = error or e
+                    continue
+                work_time += t
+                max_page_time = max(max_page_time, t)
+                if stats is not None:
+                    stats.add_page(*measured)
+                results[page_index] = result
+                if keys:
+                    self.cache.save(keys[page_index], result)  # type: ignore
+                pages_done += 1
+                if on_page_done is not None:
+                    on_page_done(pages_done, page_total)
+
+            pages = sorted(lost)
+            if not pages:
+                break
+            # the pool of this process is replaced once, other pools are the caller's
+            if retried or self.executor not in _shared_pools:
+                raise BrokenProcessPool(
+                    f"{self.__class__.__name__} {len(pages)} pages lost, a process of the pool died"
+                )
+            self.logger.warning(
+                f"{self.__class__.__name__} a process of the pool died, retry {len(pages)} pages on a new pool"
+            )
+            self.executor = get_shared_pool()
+            retried = True
+
+        if error is not None:
+            raise error
+
+        wall_time = time.perf_counter() - start
+        pool_size = getattr(self.executor, "_max_workers", 1)
+        self.logger.debug(
+            f"{self.__class__.__name__} pages wall = {wall_time:.2f}s, work = {work_time:.2f}s, max page = {max_page_time:.2f}s, "
+            f"pool overhead = {max(wall_time - work_time / pool_size, 0):.2f}s"
+        )
+        return results
+
     def save_cache(
         self,
         doc_in: DocInputParams,
@@ -104,31 +291,31 @@ class Worker:
         doc_out: DocOutputParams,
         page_out: list[PageOutputParams],
     ):
-        if not self.cache_enabled or self.__dict__.get("disable_cache"):
+        if not self.is_cache_enabled():
             return
 
-        file_pkl = (
-            Path("/tmp")
-            / "flow-pdf"
-            / "cache"
-            / doc_in.file_input.name
-            / f"{self.__class__.__name__}.pkl"
-        )
-        file_pkl.parent.mkdir(parents=True, exist_ok=True)
-
-        file.write_pkl(
-            file_pkl,
-            {
-                "src": inspect.getsource(self.__class__),
-                "doc_in": doc_in,
-                "page_in": page_in,
-                "doc_out": doc_out,
-                "page_out": page_out,
-            },
+        self.cache.save(  # type: ignore
+            self.cache_key(doc_in, page_in),
+            {"doc_out": doc_out, "page_out": page_out},
         )
 
 
 class PageWorker(Worker):
+    # pages are cached one by one in map_pages, after_run_page is cheap to redo from them
+    def load_cache(
+        self, doc_in: DocInputParams, page_in: list[PageInputParams]
+    ) -> tuple[bool, tuple[DocOutputParams, list[PageOutputParams]]]:
+        return False, (DocOutputParams(), [])
+
+    def save_cache(
+        self,
+        doc_in: DocInputParams,
+        page_in: list[PageInputParams],
+        doc_out: DocOutputParams,
+        page_out: list[PageOutputParams],
+    ):
+        pass
+
     def run(
         self, doc_in: DocInputParams, page_in: list[PageInputParams]
     ) -> tuple[DocOutputParams, list[PageOutputParams]]:
@@ -147,17 +334,10 @@ class PageWorker(Worker):
 
         page_out = []
         local_page_out = []
-
-        with concurrent.futures.ProcessPoolExecutor() as executor:
-            futures = [
-                executor.submit(self.run_page, page_index, doc_in, page_in[page_index])
-                for page_index in range(doc_in.page_count)
-            ]
-            for future in futures:
-                p_out, l_p_out = future.result()
-                page_out.append(p_out)
-                local_page_out.append(l_p_out)
-            return page_out, local_page_out
+        for p_out, l_p_out in self.map_pages(self.run_page, doc_in, page_in):
+            page_out.append(p_out)
+            local_page_out.append(l_p_out)
+        return page_out, local_page_out
 
     def post_run_page(self, doc_in: DocInputParams, page_in: list[PageInputParams]):
         pass
@@ -177,11 +357,179 @@ class PageWorker(Worker):
         return DocOutputParams()
 
 
-def create_logger(file_input: Path, dir_output: Path):
-    logger = logging.getLogger(file_input.stem)
+def get_package_modules(module_name: str) -> list[str]:
+    """
+    the module and the modules of its package it uses, directly or through another one, sorted
+    """
+    package = module_name.rpartition(".")[0]
+    seen = {module_name}
+    todo = [module_name]
+    while todo:
+        for v in vars(sys.modules[todo.pop()]).values():
+            name = v.__name__ if inspect.ismodule(v) else getattr(v, "__module__", None)
+            if isinstance(name, str) and name.startswith(package + ".") and name not in seen and name in sys.modules:
+                seen.add(name)
+                todo.append(name)
+    return sorted(seen)
+
+
+def get_source_hash(W: type) -> str:
+    """
+    sha256 of the source of the module of W and of the package modules it uses, so that a change
+    in a helper function invalidates the cache of the workers that call it
+    """
+    if "." not in W.__module__:
+        return get_class_source_hash(W.__module__, W.__qualname__)
+    return get_module_source_hash(W.__module__)
+
+
+@functools.cache
+def get_class_source_hash(module_name: str, class_name: str) -> str:
+    """
+    a worker outside a package, only its class is hashed
+    """
+    return hashlib.sha256(inspect.getsource(getattr(sys.modules[module_name], class_name)).encode()).hexdigest()
+
+
+@functools.cache
+def get_module_source_hash(module_name: str) -> str:
+    h = hashlib.sha256()
+    for name in get_package_modules(module_name):
+        h.update(name.encode())
+        h.update(inspect.getsource(sys.modules[name]).encode())
+    return h.hexdigest()
+
+
+def timed_call(fn: Callable, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def reset_peak_rss():
+    """
+    start a new peak RSS of this process, Linux only
+    """
+    try:
+        Path("/proc/self/clear_refs").write_text("5")
+    except OSError:
+        pass
+
+
+def get_peak_rss() -> int:
+    """
+    VmHWM in KiB, 0 where /proc isn't available
+    """
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def measured_call(fn: Callable, *args):
+    """
+    timed_call, with the cpu time, the peak RSS and the pickled size of the result of the page
+    """
+    reset_peak_rss()
+    cpu = time.process_time()
+    t, result = timed_call(fn, *args)
+    cpu = time.process_time() - cpu
+    return t, result, cpu, get_peak_rss(), len(pickle.dumps(result, pickle.HIGHEST_PROTOCOL))
+
+
+# modules that every page worker needs, imported once per pool process
+PRELOAD_MODULES = ["fitz", "numpy", "PIL.Image"]
+
+
+def preload(modules: list[str]):
+    for m in modules:
+        importlib.import_module(m)
+
+
+def create_pool(
+    max_workers: Optional[int] = None, preload_modules: list[str] = PRELOAD_MODULES
+) -> concurrent.futures.ProcessPoolExecutor:
+    """
+    create a process pool and start all of its processes, so that process start and imports are not paid by the first worker
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    executor = concurrent.futures.ProcessPoolExecutor(
+        max_workers=max_workers, initializer=preload, initargs=(preload_modules,)
+    )
+    # processes are spawned on demand, keep them all busy at once to force the start
+    futures = [executor.submit(time.sleep, 0.01) for _ in range(max_workers)]
+    for future in futures:
+        future.result()
+    return executor
+
+
+_shared_pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+_shared_pool_args: tuple = ()
+_shared_pool_lock = threading.Lock()
+# every pool get_shared_pool created, a page task lost with one of them is retried on the current one
+_shared_pools: "weakref.WeakSet[concurrent.futures.ProcessPoolExecutor]" = weakref.WeakSet()
+
+
+def is_broken(executor: concurrent.futures.Executor) -> bool:
+    """
+    a process of the pool died (OOM kill, crash in MuPDF), every later submit raises BrokenProcessPool
+    """
+    return bool(getattr(executor, "_broken", False))
+
+
+def get_shared_pool(
+    max_workers: Optional[int] = None, preload_modules: list[str] = PRELOAD_MODULES
+) -> concurrent.futures.ProcessPoolExecutor:
+    """
+    process-wide pool, reused by every Executer in this process.
+    a broken pool is replaced by a new one with the arguments of the first call
+    """
+    global _shared_pool, _shared_pool_args
+    with _shared_pool_lock:
+        if _shared_pool is not None and is_broken(_shared_pool):
+            _shared_pool.shutdown(wait=False, cancel_futures=True)
+            _shared_pool = None
+        if _shared_pool is None:
+            _shared_pool_args = _shared_pool_args or (max_workers, preload_modules)
+            _shared_pool = create_pool(*_shared_pool_args)
+            _shared_pools.add(_shared_pool)
+        return _shared_pool
+
+
+def get_log_file(logger: logging.Logger) -> Optional[Path]:
+    for h in logger.handlers:
+        if isinstance(h, logging.FileHandler):
+            return Path(h.baseFilename)
+    return None
+
+
+def close_file_logger(logger: logging.Logger):
+    """
+    close and remove the file handlers of logger, a pool process or a server runs thousands of documents
+    """
+    for h in logger.handlers[:]:
+        if isinstance(h, logging.FileHandler):
+            logger.removeHandler(h)
+            h.close()
+
+
+def get_file_logger(name: str, file_log: Optional[Path]) -> logging.Logger:
+    """
+    logger writing to file_log, a handler of a previous document with the same name is replaced
+    """
+    logger = logging.getLogger(name)
+    if file_log is None or get_log_file(logger) == file_log.absolute():
+        return logger
+
+    close_file_logger(logger)
     logger.setLevel(logging.DEBUG)
 
-    file_handler = logging.FileHandler(dir_output / "log.txt")
+    file_handler = logging.FileHandler(file_log)
 
     formatter = logging.Formatter(
         "%(asctime)s,%(msecs)03d %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s",
@@ -193,15 +541,334 @@ def create_logger(file_input: Path, dir_output: Path):
     return logger
 
 
+def create_logger(file_input: Path, dir_output: Path):
+    return get_file_logger(file_input.stem, dir_output / "log.txt")
+
+
+# log files a pool process keeps open, at least the documents that run at once
+WORKER_LOG_FILES = 16
+_worker_loggers: OrderedDict[str, logging.Logger] = OrderedDict()
+_worker_loggers_lock = threading.Lock()
+
+
+def get_worker_logger(name: str, file_log: Optional[Path]) -> logging.Logger:
+    """
+    get_file_logger in a pool process, the handlers of the least recently used documents are closed.
+    a document whose handler was closed gets a new one with its next task
+    """
+    with _worker_loggers_lock:
+        logger = get_file_logger(name, file_log)
+        _worker_loggers[name] = logger
+        _worker_loggers.move_to_end(name)
+        while len(_worker_loggers) > WORKER_LOG_FILES:
+            _, evicted = _worker_loggers.popitem(last=False)
+            close_file_logger(evicted)
+        return logger
+
+
 @dataclass
 class ExecuterConfig:
     version: str
     cache_enabled: bool
 
+    # None means os.cpu_count()
+    max_workers: Optional[int] = None
+    preload_modules: list[str] = field(default_factory=lambda: list(PRELOAD_MODULES))
+
+    # run consecutive page workers as one task per page, see plan_stages
+    fuse_pages: bool = False
+
+    cache_dir: Path = DEFAULT_CACHE_DIR
+    # bytes, least recently used entries are evicted above it, None means no limit
+    cache_max_size: Optional[int] = None
+
+    webp: WebpOptions = field(default_factory=WebpOptions)
+
+    # SampledPageWorkers start from a sample of this many pages, None means every page
+    sample_pages: Optional[int] = None
+
+    # record StageStats of every stage in Executer.stage_stats, page inputs and results are pickled
+    # once more to count their bytes, for benchmarks
+    measure: bool = False
+
+
+@dataclass
+class Progress:
+    # worker or fused stage running, "" after the last one
+    stage: str
+    stage_index: int
+    stage_count: int
+    # pages of the running page stage, 0 and 0 for doc level workers
+    pages_done: int = 0
+    page_count: int = 0
+    # seconds since execute started
+    elapsed: float = 0.0
+    # seconds left in the running stage, from the time of its finished pages, None when unknown
+    stage_eta: Optional[float] = None
+    # seconds of each finished stage
+    stage_times: dict[str, float] = field(default_factory=dict)
+
+
+@dataclass
+class StageStats:
+    # seconds
+    wall: float = 0.0
+    # seconds, of the parent process and of the pages in the pool
+    cpu: float = 0.0
+    # bytes of the page tasks sent to the pool and of their results, pickled
+    pickled_in: int = 0
+    pickled_out: int = 0
+    # KiB, the highest of the parent and of the pool processes while they ran a page
+    peak_rss: int = 0
+    # bytes of the files in dir_output the stage created or resized
+    output_bytes: int = 0
+
+    def add_page(self, cpu: float, peak_rss: int, pickled_out: int):
+        self.cpu += cpu
+        self.peak_rss = max(self.peak_rss, peak_rss)
+        self.pickled_out += pickled_out
+
+
+def get_output_sizes(dir_output: Path) -> dict[Path, int]:
+    return {f: f.stat().st_size for f in dir_output.rglob("*") if f.is_file()}
+
+
+def get_doc_in_class(W: type[Worker]) -> type:
+    if issubclass(W, PageWorker):
+        return W.run_page.__annotations__["doc_in"]
+    return W.run.__annotations__["doc_in"]
+
+
+def get_page_in_class(W: type[Worker]) -> type:
+    if issubclass(W, PageWorker):
+        return W.run_page.__annotations__["page_in"]
+    return W.run.__annotations__["page_in"].__args__[0]
+
+
+def get_doc_out_class(W: type[Worker]) -> type:
+    if issubclass(W, PageWorker):
+        return W.after_run_page.__annotations__["return"]
+    return W.run.__annotations__["return"].__args__[0]
+
+
+def get_page_out_class(W: type[Worker]) -> type:
+    if issubclass(W, PageWorker):
+        return W.run_page.__annotations__["return"].__args__[0]
+    return W.run.__annotations__["return"].__args__[1].__args__[0]
+
+
+def param_names(k_class: type) -> set[str]:
+    return {f.name for f in fields(k_class)}
+
+
+def params_to_dict(params) -> dict:
+    """
+    shallow version of dataclasses.asdict, which would deep copy every MPage
+    """
+    return {f.name: getattr(params, f.name) for f in fields(params)}
+
+
+def stratified_sample(page_count: int, n: int) -> list[int]:
+    """
+    the middle page of each of n equal page ranges
+    """
+    n = min(n, page_count)
+    return sorted({(2 * k + 1) * page_count // (2 * n) for k in range(n)})
+
+
+class SampledPageWorker(PageWorker):
+    """
+    page worker whose doc output is a statistic over the pages, and whose page output is empty.
+
+    with sample_pages set it first runs on a stratified sample of that many pages. the estimate is accepted when
+    the two interleaved halves of the sample give agreeing estimates, and so do held out pages, a stratified sample
+    of half as many pages outside it. otherwise the sample is doubled, up to all pages.
+    """
+
+    # pages in the first sample, not set means every page
+    sample_pages: Optional[int]
+
+    def estimates_agree(self, a: DocOutputParams, b: DocOutputParams) -> bool:
+        return a == b
+
+    def run(
+        self, doc_in: DocInputParams, page_in: list[PageInputParams]
+    ) -> tuple[DocOutputParams, list[PageOutputParams]]:
+        n = self.__dict__.get("sample_pages")
+        if not n or n >= doc_in.page_count:
+            return super().run(doc_in, page_in)
+
+        self.post_run_page(doc_in, page_in)
+
+        results: list = [None] * doc_in.page_count
+        sampled: list[int] = []
+
+        def run_pages(pages: list[int]):
+            nonlocal sampled
+            for i, r in enumerate(self.map_pages(self.run_page, doc_in, page_in, pages=pages)):
+                if r is not None:
+                    results[i] = r
+            sampled = sorted(sampled + pages)
+
+        def estimate(pages: list[int]) -> DocOutputParams:
+            return self.after_run_page(
+                doc_in,
+                [page_in[i] for i in pages],
+                [results[i][0] for i in pages],
+                [results[i][1] for i in pages],
+            )
+
+        while True:
+            run_pages([i for i in stratified_sample(doc_in.page_count, n) if results[i] is None])
+
+            if len(sampled) == doc_in.page_count:
+                doc_out = estimate(sampled)
+                break
+
+            try:
+                doc_out = estimate(sampled)
+                agree = self.estimates_agree(
+                    doc_out, estimate(sampled[0::2])
+                ) and self.estimates_agree(doc_out, estimate(sampled[1::2]))
+                if agree:
+                    # the halves share the blind spots of the sample, pages outside it don't
+                    rest = [i for i in range(doc_in.page_count) if results[i] is None]
+                    held_out = [rest[j] for j in stratified_sample(len(rest), max(len(sampled) // 2, 1))]
+                    run_pages(held_out)
+                    agree = self.estimates_agree(doc_out, estimate(held_out))
+                    doc_out = estimate(sampled)
+            except Exception as e:
+                self.logger.debug(f"{self.__class__.__name__} estimate failed: {e}")
+                agree = False
+            if agree:
+                break
+            n *= 2
+
+        self.logger.info(
+            f"{self.__class__.__name__} sampled {len(sampled)} of {doc_in.page_count} pages"
+        )
+        page_out_class = get_page_out_class(self.__class__)
+        return doc_out, [page_out_class() for _ in range(doc_in.page_count)]
+
+
+def get_used_outputs(workers: list[type]) -> dict[type, set[str]]:
+    """
+    for each worker, its outputs that a later worker takes as input
+    """
+    used: dict[type, set[str]] = {}
+    read: set[str] = set()
+    for W in reversed(workers):
+        outputs = param_names(get_doc_out_class(W)) | param_names(get_page_out_class(W))
+        used[W] = outputs & read
+        read |= param_names(get_doc_in_class(W)) | param_names(get_page_in_class(W))
+    return used
+
+
+def plan_stages(workers: list[type], sampled: bool = False) -> list[list[type]]:
+    """
+    group consecutive page workers into stages that run as one task per page.
+
+    a page worker joins the current stage unless its doc_in needs a field produced by
+    after_run_page of a worker already in the stage, that reduction is a real barrier.
+    other workers always get a stage of their own, so do SampledPageWorkers when sampled is set.
+    """
+
+    def is_fusible(W: type) -> bool:
+        return issubclass(W, PageWorker) and not (
+            sampled and issubclass(W, SampledPageWorker)
+        )
+
+    stages: list[list[type]] = []
+    pending_doc: set[str] = set()  # doc params produced inside the current stage
+    for W in workers:
+        fusible = stages and is_fusible(W) and is_fusible(stages[-1][-1])
+        if fusible and not param_names(get_doc_in_class(W)) & pending_doc:
+            stages[-1].append(W)
+        else:
+            stages.append([W])
+            pending_doc = set()
+
+        if issubclass(W, Worker):
+            pending_doc |= param_names(get_doc_out_class(W))
+    return stages
+
+
+class FusedPageWorker(Worker):
+    """
+    runs run_page of several page workers back to back in the same process,
+    page params passed between them never leave the child.
+
+    the page cache of each worker is checked in the child, where its page inputs are known,
+    so fused and unfused runs share entries.
+    """
+
+    def __init__(self, workers: list[PageWorker], doc_ins: list[DocInputParams]):
+        super().__init__()
+        self.workers = workers
+        self.doc_ins = doc_ins
+        # doc_cache_hash of each worker, "" when it doesn't cache
+        self.doc_keys = [
+            w.doc_cache_hash(d).hexdigest() if w.is_cache_enabled() else ""
+            for w, d in zip(workers, doc_ins)
+        ]
+        # the stage itself isn't cached, its workers are
+        self.cache_enabled = False
+
+    def run_page(
+        self, page_index: int, doc_in: DocInputParams, page_params: dict
+    ) -> tuple[list[PageOutputParams], list[LocalPageOutputParams], int, int]:
+        """
+        returns page outputs, local page outputs, cache hits and misses
+        """
+        page_params = dict(page_params)
+        page_out = []
+        local_page_out = []
+        hits = 0
+        misses = 0
+        for w, w_doc_in, doc_key in zip(self.workers, self.doc_ins, self.doc_keys):
+            k_class = get_page_in_class(type(w))
+            page_in = k_class(*[page_params[f.name] for f in fields(k_class)])
+
+            result = None
+            if doc_key:
+                key = w.page_cache_key(doc_key, w.run_page, page_index, page_in, ())
+                result = w.cache.load(key)  # type: ignore
+            if result is None:
+                result = w.run_page(page_index, w_doc_in, page_in)
+                if doc_key:
+                    w.cache.save(key, result)  # type: ignore
+                    misses += 1
+            else:
+                hits += 1
+
+            p_out, l_p_out = result
+            page_params.update(params_to_dict(p_out))
+            page_out.append(p_out)
+            local_page_out.append(l_p_out)
+        return page_out, local_page_out, hits, misses
+
+
+# PyMuPDF isn't thread safe, Executers of several documents can run in threads of one process.
+# workers open the pdf in the pool processes, only the parent side is guarded
+fitz_lock = threading.Lock()
+
 
 class Executer:
-    def __init__(self, file_input: Path, dir_output: Path, config: ExecuterConfig):
-        with fitz.open(file_input) as doc:  # type: ignore
+    def __init__(
+        self,
+        file_input: Path,
+        dir_output: Path,
+        config: ExecuterConfig,
+        executor: Optional[concurrent.futures.ProcessPoolExecutor] = None,
+        doc_hash: Optional[str] = None,
+        on_progress: Optional[Callable[[Progress], None]] = None,
+    ):
+        """
+        executor: pool shared with other documents, when not set the Executer owns a pool for this document
+        doc_hash: sha256 of file_input if the caller already has it, used as cache key
+        on_progress: called in the thread of execute when a stage starts or finishes and when a page finishes
+        """
+        with fitz_lock, fitz.open(file_input) as doc:  # type: ignore
             page_count = doc.page_count
 
         self.store = ParamsStore(page_count)
@@ -210,56 +877,233 @@ class Executer:
 
         self.logger = create_logger(file_input, dir_output)
         self.config = config
+        self.executor = executor
+
+        self.cache: Optional[WorkerCache] = None
+        self.doc_hash = ""
+        if config.cache_enabled:
+            self.cache = WorkerCache(config.cache_dir)
+            self.doc_hash = doc_hash or file_hash(file_input)
+
+        self.used_outputs: dict[type, set[str]] = {}
+
+        self.on_progress = on_progress
+        self.progress = Progress("", 0, 0)
+        # stage name -> StageStats, see ExecuterConfig.measure
+        self.stage_stats: dict[str, StageStats] = {}
+        self.stats: Optional[StageStats] = None
+        self.start_time = time.perf_counter()
+        self.stage_start_time = self.start_time
 
-    def register(self, workers: list[type]):
+    def register(self, workers: Sequence[type]):
         self.workers = workers
 
     def execute(self):
-        for W in self.workers:
-            self.logger.info(f"{W.__name__} start")
-            start = time.perf_counter()
+        try:
+            if self.executor is not None:
+                self.execute_workers(self.executor)
+                return
 
-            if issubclass(W, PageWorker):
-                w_method = W.run_page
-            elif issubclass(W, Worker):
-                w_method = W.run
+            start = time.perf_counter()
+            executor = create_pool(
+                self.config.max_workers, self.config.preload_modules
+            )
+            self.logger.info(
+                f"pool started, time = {(time.perf_counter() - start):.2f}s"
+            )
+            try:
+                self.execute_workers(executor)
+            finally:
+                start = time.perf_counter()
+                executor.shutdown()
+                self.logger.info(
+                    f"pool shutdown, time = {(time.perf_counter() - start):.2f}s"
+                )
+        finally:
+            if self.cache is not None:
+                if self.config.cache_max_size is not None:
+                    self.cache.evict(self.config.cache_max_size)
+                self.logger.info(
+                    f"cache hits = {self.cache.hits}, misses = {self.cache.misses}, evictions = {self.cache.evictions}"
+                )
+            close_file_logger(self.logger)
+
+    def execute_workers(self, executor: concurrent.futures.ProcessPoolExecutor):
+        workers = []
+        for W in self.workers:
+            if issubclass(W, Worker):
+                workers.append(W)
             else:
                 self.logger.warning(f"{W.__name__} is not a worker")
-                continue
-
-            k = "doc_in"
-            k_class = w_method.__annotations__[k]  # type: ignore
-            param_names = [f.name for f in fields(k_class)]
-            params = [self.store.doc_get(n) for n in param_names]
-            doc_in = k_class(*params)
-
-            k = "page_in"
-            if issubclass(W, PageWorker):
-                k_class = w_method.__annotations__[k]  # type: ignore
-            elif issubclass(W, Worker):
-                k_class = w_method.__annotations__[k].__args__[0]  # type: ignore
-
-            param_names = [f.name for f in fields(k_class)]
-            page_in = []
-            for i in range(self.store.doc_get("page_count")):
-                params = [self.store.page_get(n, i) for n in param_names]
-                page_in.append(k_class(*params))
-
-            w = W()
-            w.logger = self.logger
-            w.version = self.config.version
-            w.cache_enabled = self.config.cache_enabled
-
-            doc_out, page_out = w.post_run(doc_in, page_in)
-            for k, v in asdict(doc_out).items():
-                self.store.doc_set(k, v)
-            for i, p in enumerate(page_out):
-                for k, v in asdict(p).items():
-                    self.store.page_set(k, i, v)
 
-            self.logger.info(
-                f"{W.__name__} finished, time = {(time.perf_counter() - start):.2f}s"
-            )
+        self.used_outputs = get_used_outputs(workers)
+
+        if self.config.fuse_pages:
+            stages = plan_stages(workers, self.config.sample_pages is not None)
+        else:
+            stages = [[W] for W in workers]
+
+        self.start_time = time.perf_counter()
+        for i, stage in enumerate(stages):
+            if is_broken(executor) and executor in _shared_pools:
+                executor = self.executor = get_shared_pool()
+            name = " + ".join(W.__name__ for W in stage)
+            self.progress.stage, self.progress.stage_index, self.progress.stage_count = name, i, len(stages)
+            if self.config.measure:
+                self.stats = self.stage_stats[name] = StageStats()
+                output_sizes = get_output_sizes(self.store.doc_get("dir_output"))
+                reset_peak_rss()
+                cpu = time.process_time()
+            self.stage_start_time = time.perf_counter()
+            self.report_pages(0, 0)
+
+            if len(stage) == 1:
+                self.execute_worker(stage[0], executor)
+            else:
+                self.execute_fused(stage, executor)
+
+            self.progress.stage_times[name] = time.perf_counter() - self.stage_start_time
+            if self.stats is not None:
+                self.stats.wall = self.progress.stage_times[name]
+                self.stats.cpu += time.process_time() - cpu
+                self.stats.peak_rss = max(self.stats.peak_rss, get_peak_rss())
+                self.stats.output_bytes = sum(
+                    size
+                    for f, size in get_output_sizes(self.store.doc_get("dir_output")).items()
+                    if size != output_sizes.get(f)
+                )
+                self.logger.debug(f"{name} {self.stats}")
+
+        self.progress.stage, self.progress.stage_index = "", len(stages)
+        self.report_pages(0, 0)
+
+    def report_pages(self, pages_done: int, page_count: int):
+        now = time.perf_counter()
+        p = self.progress
+        p.pages_done, p.page_count = pages_done, page_count
+        p.elapsed = now - self.start_time
+        if 0 < pages_done < page_count:
+            p.stage_eta = (now - self.stage_start_time) / pages_done * (page_count - pages_done)
+        elif pages_done == page_count and page_count > 0:
+            p.stage_eta = 0.0
+        else:
+            p.stage_eta = None
+
+        if self.on_progress is None:
+            return
+        try:
+            self.on_progress(p)
+        except Exception as e:
+            self.logger.warning(f"on_progress error: {e}")
+
+    def make_doc_in(self, W: type) -> DocInputParams:
+        k_class = get_doc_in_class(W)
+        params = [self.store.doc_get(f.name) for f in fields(k_class)]
+        return k_class(*params)
+
+    def make_page_in(self, W: type) -> list[PageInputParams]:
+        k_class = get_page_in_class(W)
+        names = [f.name for f in fields(k_class)]
+        page_in = []
+        for i in range(self.store.doc_get("page_count")):
+            params = [self.store.page_get(n, i) for n in names]
+            page_in.append(k_class(*params))
+        return page_in
+
+    def make_worker(self, W: type, executor: concurrent.futures.Executor) -> Worker:
+        w = W()
+        w.logger = self.logger
+        w.version = self.config.version
+        w.cache_enabled = self.config.cache_enabled
+        w.cache = self.cache
+        w.doc_hash = self.doc_hash
+        w.executor = executor
+        w.on_page_done = self.report_pages
+        w.webp = self.config.webp
+        if self.stats is not None:
+            w.stats = self.stats
+        if W in self.used_outputs:
+            w.used_outputs = self.used_outputs[W]
+        if issubclass(W, SampledPageWorker):
+            w.sample_pages = self.config.sample_pages
+        return w
+
+    def save_outputs(self, doc_out: DocOutputParams, page_out: list):
+        for k, v in params_to_dict(doc_out).items():
+            self.store.doc_set(k, v)
+        for i, p in enumerate(page_out):
+            for k, v in params_to_dict(p).items():
+                self.store.page_set(k, i, v)
+
+    def execute_worker(self, W: type, executor: concurrent.futures.Executor):
+        self.logger.info(f"{W.__name__} start")
+        start = time.perf_counter()
+
+        doc_in = self.make_doc_in(W)
+        page_in = self.make_page_in(W)
+
+        w = self.make_worker(W, executor)
+        doc_out, page_out = w.post_run(doc_in, page_in)
+        self.save_outputs(doc_out, page_out)
+
+        self.logger.info(
+            f"{W.__name__} finished, time = {(time.perf_counter() - start):.2f}s"
+        )
+
+    def execute_fused(self, stage: list[type], executor: concurrent.futures.Executor):
+        name = " + ".join(W.__name__ for W in stage)
+        self.logger.info(f"{name} start, fused")
+        start = time.perf_counter()
+
+        # page params produced inside the stage are passed along in the child
+        produced: set[str] = set()
+        external: set[str] = set()
+        workers: list[PageWorker] = []
+        doc_ins = []
+        for W in stage:
+            external |= param_names(get_page_in_class(W)) - produced
+            produced |= param_names(get_page_out_class(W))
+
+            doc_in = self.make_doc_in(W)
+            w = self.make_worker(W, executor)
+            # page inputs of later stage members don't exist in the parent yet
+            w.post_run_page(doc_in, [])  # type: ignore
+            workers.append(w)  # type: ignore
+            doc_ins.append(doc_in)
+
+        fused = FusedPageWorker(workers, doc_ins)
+        fused.logger = self.logger
+        fused.executor = executor
+        fused.on_page_done = self.report_pages
+        if self.stats is not None:
+            fused.stats = self.stats
+
+        # sorted, so that objects shared by params (big_blocks lines of page_info) are always
+        # pickled in the same order, the size of a page task depends on it
+        page_params = [
+            {n: self.store.page_get(n, i) for n in sorted(external)}
+            for i in range(self.store.doc_get("page_count"))
+        ]
+        results = fused.map_pages(fused.run_page, doc_ins[0], page_params)
+        if self.cache is not None:
+            hits = sum(r[2] for r in results)
+            misses = sum(r[3] for r in results)
+            self.cache.hits += hits
+            self.cache.misses += misses
+            self.logger.debug(f"{name} pages cached = {hits}, run = {misses}")
+
+        # doc level reductions, in worker order
+        for j, (W, w, doc_in) in enumerate(zip(stage, workers, doc_ins)):
+            page_in = self.make_page_in(W)
+            page_out = [r[0][j] for r in results]
+            local_page_out = [r[1][j] for r in results]
+
+            doc_out = w.after_run_page(doc_in, page_in, page_out, local_page_out)
+            self.save_outputs(doc_out, page_out)
+
+        self.logger.info(
+            f"{name} finished, time = {(time.perf_counter() - start):.2f}s"
+        )
 
 
 class ParamsStore:
@@ -295,11 +1139,12 @@ def is_common_span(
 
 
 def get_min_bounding_rect(rects: list[Rectangle]) -> Rectangle:
-    x0 = min(rects, key=lambda r: r.x0).x0
-    y0 = min(rects, key=lambda r: r.y0).y0
-    x1 = max(rects, key=lambda r: r.x1).x1
-    y1 = max(rects, key=lambda r: r.y1).y1
-    return Rectangle(x0, y0, x1, y1)
+    x0 = min([r.x0 for r in rects])
+    y0 = min([r.y0 for r in rects])
+    x1 = max([r.x1 for r in rects])
+    y1 = max([r.y1 for r in rects])
+    # bounds of valid rectangles are valid
+    return init_rectangle_unchecked(x0, y0, x1, y1)
 
 
 class RectRelation(Enum):
@@ -328,6 +1173,88 @@ def rectangle_relation(rect1: Rectangle, rect2: Rectangle) -> RectRelation:
     return RectRelation.INTERSECT
 
 
+class RectIndex:
+    """
+    uniform grid over a page, finds the rects intersecting a rect without comparing it to every rect of the page.
+
+    rects can be Rectangle or fitz.Rect, rects outside of the page go to the border cells
+    """
+
+    MAX_CELLS = 32  # per side
+    # below it a Python loop over the candidates is faster than building arrays
+    MIN_VECTORIZED = 48
+
+    def __init__(self, rects: list, width: float, height: float):
+        self.rects = rects
+        self.array = geometry.to_array(rects)
+        self.n = max(1, min(RectIndex.MAX_CELLS, int(len(rects) ** 0.5)))
+        self.cell_w = width / self.n if width > 0 else 1.0
+        self.cell_h = height / self.n if height > 0 else 1.0
+
+        self.cells: list[list[int]] = [[] for _ in range(self.n * self.n)]
+        for i, r in enumerate(rects):
+            for c in self.get_cells(r):
+                self.cells[c].append(i)
+
+    def get_cell_index(self, v: float, cell_size: float) -> int:
+        v = v / cell_size
+        # compare before int(), v may be inf
+        if v < 0:
+            return 0
+        if v >= self.n:
+            return self.n - 1
+        return int(v)
+
+    def get_cells(self, r) -> list[int]:
+        cx0 = self.get_cell_index(r.x0, self.cell_w)
+        cx1 = self.get_cell_index(r.x1, self.cell_w)
+        cy0 = self.get_cell_index(r.y0, self.cell_h)
+        cy1 = self.get_cell_index(r.y1, self.cell_h)
+        return [
+            cy * self.n + cx for cy in range(cy0, cy1 + 1) for cx in range(cx0, cx1 + 1)
+        ]
+
+    def search(
+        self, rect: Rectangle, relation: Optional[RectRelation] = None
+    ) -> list[int]:
+        """
+        indices of the rects whose rectangle_relation(rect, r) is relation, by default any but NOT_INTERSECT, in insertion order
+        """
+        cells = self.get_cells(rect)
+        if len(cells) == 1:
+            candidates = self.cells[cells[0]]
+        else:
+            candidates = sorted({i for c in cells for i in self.cells[c]})
+
+        if len(candidates) < RectIndex.MIN_VECTORIZED:
+            if relation is None:
+                return [
+                    i
+                    for i in candidates
+                    if rectangle_relation(rect, self.rects[i])
+                    != RectRelation.NOT_INTERSECT
+                ]
+            return [
+                i
+                for i in candidates
+                if rectangle_relation(rect, self.rects[i]) == relation
+            ]
+
+        indices = np.array(candidates, dtype=np.intp)
+        a = np.array(rect.to_tuple())
+        b = self.array[indices]
+        if relation is None:
+            mask = geometry.intersects(a, b)
+        else:
+            mask = geometry.relation_mask(a, b, relation.value)
+        return indices[mask].tolist()
+
+    def search_rects(
+        self, rect: Rectangle, relation: Optional[RectRelation] = None
+    ) -> list:
+        return [self.rects[i] for i in self.search(rect, relation)]
+
+
 def add_annot(page: Page, rects: list[Rectangle], annot: str, color: str):
     if not rects:
         return
@@ -349,30 +1276,106 @@ def add_annot(page: Page, rects: list[Rectangle], annot: str, color: str):
         page.draw_rect(r, color=fitz.utils.getColor(color))  # type: ignore
 
 
-def frequent_sub_array(arr: list[float], sub_arr_range: float) -> list[float]:
+def dbscan_1d(values: list[float], eps: float, min_samples: int) -> list[int]:
+    """
+    labels of sklearn's DBSCAN(eps, min_samples) on 1-D values, -1 is noise, with a sort and a gap scan.
+
+    a point is core when at least min_samples points (itself included) are within eps, consecutive core points
+    closer than eps share a cluster, other points within eps of a core join the cluster seeded first,
+    clusters are numbered in the order of their first core point, like sklearn.
+    distances equal to eps are compared exactly, sklearn may round them either way.
     """
-    Returns a contiguous subarray of arr with the most elements, and the difference between the maximum and minimum values of that subarray is less than sub_arr_range
+    n = len(values)
+    order = np.argsort(values, kind="stable")
+    x = [values[i] for i in order.tolist()]
+
+    # points within eps of x[k] are x[lo[k]:hi[k] + 1]
+    lo = [0] * n
+    hi = [0] * n
+    j = 0
+    for k in range(n):
+        while x[k] - x[j] > eps:
+            j += 1
+        lo[k] = j
+    j = n - 1
+    for k in reversed(range(n)):
+        while x[j] - x[k] > eps:
+            j -= 1
+        hi[k] = j
+    is_core = [hi[k] - lo[k] + 1 >= min_samples for k in range(n)]
+
+    # clusters of core points, in sorted order
+    cluster = [-1] * n
+    clusters = 0
+    last_core = -1
+    for k in range(n):
+        if not is_core[k]:
+            continue
+        if last_core == -1 or x[k] - x[last_core] > eps:
+            clusters += 1
+        cluster[k] = clusters - 1
+        last_core = k
+
+    # sklearn numbers clusters by their core point with the lowest index
+    seed = [n] * clusters
+    for k in range(n):
+        if is_core[k]:
+            seed[cluster[k]] = min(seed[cluster[k]], int(order[k]))
+
+    # border points, the nearest core on each side is the only cluster reachable from it
+    prev_core = -1
+    for k in range(n):
+        if is_core[k]:
+            prev_core = k
+        elif prev_core != -1 and x[k] - x[prev_core] <= eps:
+            cluster[k] = cluster[prev_core]
+    next_core = -1
+    for k in reversed(range(n)):
+        if is_core[k]:
+            next_core = k
+        elif next_core != -1 and x[next_core] - x[k] <= eps:
+            c = cluster[next_core]
+            if cluster[k] == -1 or seed[c] < seed[cluster[k]]:
+                cluster[k] = c
+
+    number = {c: i for i, c in enumerate(sorted(range(clusters), key=lambda c: seed[c]))}
+    labels = [-1] * n
+    for k in range(n):
+        if cluster[k] != -1:
+            labels[int(order[k])] = number[cluster[k]]
+    return labels
+
+
+def frequent_window(
+    counter: dict[float, int], sub_arr_range: float
+) -> tuple[float, float, int]:
     """
+    Returns (min, max, count) of the values within sub_arr_range of each other with the largest total count,
+    counter maps each value to how many times it appears.
 
-    if len(arr) == 0:
-        raise ValueError("arr is empty")
+    Same window as sorting every occurrence and taking the longest run whose max - min <= sub_arr_range,
+    on ties the lowest one, but in O(distinct values log distinct values)
+    """
 
-    arr.sort()
+    # values that never appear would widen the window
+    values = sorted(v for v, c in counter.items() if c > 0)
+    if not values:
+        raise ValueError("counter is empty")
 
     max_start = 0
     max_end = 0
-    max_len = 1
+    max_count = 0
 
     start = 0
-    end = 0
-    while end < len(arr):
-        if arr[end] - arr[start] > sub_arr_range:
+    count = 0
+    for end, v in enumerate(values):
+        count += counter[v]
+        while v - values[start] > sub_arr_range:
+            count -= counter[values[start]]
             start += 1
-        else:
-            if end - start + 1 > max_len:
-                max_len = end - start + 1
-                max_start = start
-                max_end = end
-            end += 1
+        if count > max_count:
+            max_count = count
+            max_start = start
+            max_end = end
 
-    return arr[max_start : max_end + 1]
+    return values[max_start], values[max_end], max_count
@@ -0,0 +1,258 @@
+from typing import Optional, Union
+
+import numpy as np
+
+from .flow_type import (
+    MPage,
+    MTextBlock,
+    MImageBlock,
+    MLine,
+    MSpan,
+    MChar,
+    init_rectangle_unchecked,
+    init_point_unchecked,
+    init_mchar_unchecked,
+)
+
+# one row per element, children of a row are rows [start, end) of the next table
+BLOCK_DTYPE = np.dtype(
+    [
+        ("bbox", "f8", 4),
+        ("number", "i4"),
+        ("type", "i1"),  # 0 = text, 1 = image
+        ("line_start", "i4"),
+        ("line_end", "i4"),
+    ]
+)
+LINE_DTYPE = np.dtype(
+    [
+        ("bbox", "f8", 4),
+        ("wmode", "i1"),
+        ("dir", "f8", 2),
+        ("block", "i4"),
+        ("span_start", "i4"),
+        ("span_end", "i4"),
+    ]
+)
+SPAN_DTYPE = np.dtype(
+    [
+        ("bbox", "f8", 4),
+        ("origin", "f8", 2),
+        ("color", "i8"),
+        ("font", "i4"),  # index in CompactPage.fonts
+        ("size", "f8"),
+        ("flags", "i4"),
+        ("line", "i4"),
+        ("char_start", "i4"),
+        ("char_end", "i4"),
+    ]
+)
+CHAR_DTYPE = np.dtype(
+    [
+        ("bbox", "f8", 4),
+        ("origin", "f8", 2),
+        ("c", "u4"),  # code point, a U1 column would drop a "\x00" glyph
+        ("span", "i4"),
+    ]
+)
+
+
+# rows of the tables before they become arrays, fields in dtype order
+Bbox = tuple[float, float, float, float]
+Point = tuple[float, float]
+BlockRow = tuple[Bbox, int, int, int, int]
+LineRow = tuple[Bbox, int, Point, int, int, int]
+SpanRow = tuple[Bbox, Point, int, int, float, int, int, int, int]
+CharRow = tuple[Bbox, Point, int, int]
+
+
+class CompactPage(MPage):
+    """
+    MPage backed by one structured array per level instead of one Python object per glyph.
+
+    blocks / get_text_blocks() build the usual MTextBlock, MLine, MSpan and MChar objects on first use,
+    they are cached on this instance and never pickled, so only the arrays cross process boundaries.
+    """
+
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        fonts: list[str],
+        blocks: np.ndarray,
+        lines: np.ndarray,
+        spans: np.ndarray,
+        chars: np.ndarray,
+    ):
+        self.width = width
+        self.height = height
+        self.fonts = fonts
+        self.block_table = blocks
+        self.line_table = lines
+        self.span_table = spans
+        self.char_table = chars
+        self._blocks: Optional[list[Union[MTextBlock, MImageBlock]]] = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_blocks"] = None
+        return state
+
+    @property
+    def blocks(self) -> list[Union[MTextBlock, MImageBlock]]:  # type: ignore[override]
+        if self._blocks is None:
+            self._blocks = self.build_blocks()
+        return self._blocks
+
+    def build_blocks(self) -> list[Union[MTextBlock, MImageBlock]]:
+        c = self.char_table
+        chars = [
+            init_mchar_unchecked(
+                init_rectangle_unchecked(*bbox), chr(ch), init_point_unchecked(*origin)
+            )
+            for bbox, ch, origin in zip(
+                c["bbox"].tolist(), c["c"].tolist(), c["origin"].tolist()
+            )
+        ]
+
+        s = self.span_table
+        spans = [
+            MSpan(
+                init_rectangle_unchecked(*bbox),
+                color,
+                self.fonts[font],
+                size,
+                flags,
+                init_point_unchecked(*origin),
+                chars[start:end],
+            )
+            for bbox, color, font, size, flags, origin, start, end in zip(
+                s["bbox"].tolist(),
+                s["color"].tolist(),
+                s["font"].tolist(),
+                s["size"].tolist(),
+                s["flags"].tolist(),
+                s["origin"].tolist(),
+                s["char_start"].tolist(),
+                s["char_end"].tolist(),
+            )
+        ]
+
+        li = self.line_table
+        lines = [
+            MLine(
+                init_rectangle_unchecked(*bbox),
+                wmode,
+                init_point_unchecked(*dir),
+                spans[start:end],
+            )
+            for bbox, wmode, dir, start, end in zip(
+                li["bbox"].tolist(),
+                li["wmode"].tolist(),
+                li["dir"].tolist(),
+                li["span_start"].tolist(),
+                li["span_end"].tolist(),
+            )
+        ]
+
+        b = self.block_table
+        blocks: list[Union[MTextBlock, MImageBlock]] = []
+        for bbox, number, block_type, start, end in zip(
+            b["bbox"].tolist(),
+            b["number"].tolist(),
+            b["type"].tolist(),
+            b["line_start"].tolist(),
+            b["line_end"].tolist(),
+        ):
+            if block_type == 0:
+                blocks.append(
+                    MTextBlock(init_rectangle_unchecked(*bbox), number, lines[start:end])
+                )
+            else:
+                blocks.append(MImageBlock(init_rectangle_unchecked(*bbox), number))
+        return blocks
+
+    def get_image_blocks(self) -> list[MImageBlock]:
+        if self._blocks is not None:
+            return super().get_image_blocks()
+
+        # no need to build the text of the page
+        b = self.block_table[self.block_table["type"] == 1]
+        return [
+            MImageBlock(init_rectangle_unchecked(*bbox), number)
+            for bbox, number in zip(b["bbox"].tolist(), b["number"].tolist())
+        ]
+
+
+def init_compact_page_from_mupdf(mupdf_page) -> CompactPage:
+    font_index: dict[str, int] = {}
+    blocks: list[BlockRow] = []
+    lines: list[LineRow] = []
+    spans: list[SpanRow] = []
+    chars: list[CharRow] = []
+
+    for mupdf_block in mupdf_page["blocks"]:
+        block_type = mupdf_block["type"]
+        if block_type not in (0, 1):
+            raise ValueError("Unknown block type")
+
+        line_start = len(lines)
+        for mupdf_line in mupdf_block["lines"] if block_type == 0 else []:
+            span_start = len(spans)
+            for mupdf_span in mupdf_line["spans"]:
+                char_start = len(chars)
+                for mupdf_char in mupdf_span["chars"]:
+                    chars.append(
+                        (
+                            mupdf_char["bbox"],
+                            mupdf_char["origin"],
+                            ord(mupdf_char["c"]),
+                            len(spans),
+                        )
+                    )
+
+                font = mupdf_span["font"]
+                if font not in font_index:
+                    font_index[font] = len(font_index)
+                spans.append(
+                    (
+                        mupdf_span["bbox"],
+                        mupdf_span["origin"],
+                        mupdf_span["color"],
+                        font_index[font],
+                        mupdf_span["size"],
+                        mupdf_span["flags"],
+                        len(lines),
+                        char_start,
+                        len(chars),
+                    )
+                )
+            lines.append(
+                (
+                    mupdf_line["bbox"],
+                    mupdf_line["wmode"],
+                    mupdf_line["dir"],
+                    len(blocks),
+                    span_start,
+                    len(spans),
+                )
+            )
+        blocks.append(
+            (
+                mupdf_block["bbox"],
+                mupdf_block["number"],
+                block_type,
+                line_start,
+                len(lines),
+            )
+        )
+
+    return CompactPage(
+        mupdf_page["width"],
+        mupdf_page["height"],
+        list(font_index),
+        np.array(blocks, dtype=BLOCK_DTYPE),
+        np.array(lines, dtype=LINE_DTYPE),
+        np.array(spans, dtype=SPAN_DTYPE),
+        np.array(chars, dtype=CHAR_DTYPE),
+    )
@@ -180,7 +180,10 @@ class DumpWorker(PageWorker):
 
             file.write_json(
                 doc_in.dir_output / "shot_rects" / f"{page_index}.json",
-                page_in.shot_rects,
+                [
+                    [[r.to_dict() for r in shot] for shot in shots]
+                    for shots in page_in.shot_rects
+                ],
             )
 
             # big column
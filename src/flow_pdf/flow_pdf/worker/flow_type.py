@@ -1,6 +1,9 @@
 from typing import Union
 from typing import NamedTuple
 
+# the init_*_unchecked functions build instances without running __init__
+_new = object.__new__
+
 
 class Range(NamedTuple):
     min: float
@@ -11,6 +14,8 @@ class Range(NamedTuple):
 
 
 class Point:
+    __slots__ = ("x", "y")
+
     x: float
     y: float
 
@@ -22,13 +27,20 @@ class Point:
         return f"Point({self.x}, {self.y})"
 
 
+def init_point_unchecked(x: float, y: float) -> Point:
+    p = _new(Point)
+    p.x = x
+    p.y = y
+    return p
+
+
 def init_point_from_mupdf(mupdf_point) -> Point:
-    x = mupdf_point[0]
-    y = mupdf_point[1]
-    return Point(x, y)
+    return init_point_unchecked(mupdf_point[0], mupdf_point[1])
 
 
 class Rectangle:
+    __slots__ = ("x0", "y0", "x1", "y1")
+
     x0: float
     y0: float
     x1: float
@@ -60,13 +72,26 @@ class Rectangle:
     def width(self) -> float:
         return self.x1 - self.x0
 
+    def to_dict(self) -> dict[str, float]:
+        return {"x0": self.x0, "y0": self.y0, "x1": self.x1, "y1": self.y1}
+
+
+def init_rectangle_unchecked(x0: float, y0: float, x1: float, y1: float) -> Rectangle:
+    """
+    for trusted input like MuPDF output or bounds of valid rectangles, skips the x0 <= x1, y0 <= y1 checks of Rectangle()
+    """
+    r = _new(Rectangle)
+    r.x0 = x0
+    r.y0 = y0
+    r.x1 = x1
+    r.y1 = y1
+    return r
+
 
 def init_rectangle_from_mupdf(mupdf_rect) -> Rectangle:
-    x0 = mupdf_rect[0]
-    y0 = mupdf_rect[1]
-    x1 = mupdf_rect[2]
-    y1 = mupdf_rect[3]
-    return Rectangle(x0, y0, x1, y1)
+    return init_rectangle_unchecked(
+        mupdf_rect[0], mupdf_rect[1], mupdf_rect[2], mupdf_rect[3]
+    )
 
 
 # `color` is the text color encoded in sRGB (int) format, e.g. 0xFF0000 for red. There are functions for converting this integer back to formats (r, g, b) (PDF with float values from 0 to 1) sRGB_to_pdf(), or (R, G, B), sRGB_to_rgb() (with integer values from 0 to 255).
@@ -86,6 +111,8 @@ WritingMode = int
 
 
 class MChar:
+    __slots__ = ("bbox", "c", "origin")
+
     bbox: Rectangle
     c: str
     origin: Point
@@ -102,14 +129,24 @@ class MChar:
         return f"MChar({self.bbox}, {self.c}, {self.origin})"
 
 
+def init_mchar_unchecked(bbox: Rectangle, c: str, origin: Point) -> MChar:
+    char = _new(MChar)
+    char.bbox = bbox
+    char.c = c
+    char.origin = origin
+    return char
+
+
 def init_mchar_from_mupdf(mupdf_char) -> MChar:
     bbox = init_rectangle_from_mupdf(mupdf_char["bbox"])
     c = mupdf_char["c"]
     origin = init_point_from_mupdf(mupdf_char["origin"])
-    return MChar(bbox, c, origin)
+    return init_mchar_unchecked(bbox, c, origin)
 
 
 class MSpan:
+    __slots__ = ("bbox", "color", "font", "size", "flags", "origin", "chars")
+
     bbox: Rectangle
     color: RGB
     font: str
@@ -152,6 +189,8 @@ def init_mspan_from_mupdf(mupdf_span) -> MSpan:
 
 
 class MLine:
+    __slots__ = ("bbox", "wmode", "dir", "spans")
+
     bbox: Rectangle
     wmode: WritingMode
     # writing direction, point_like
@@ -179,6 +218,8 @@ def init_mline_from_mupdf(mupdf_line) -> MLine:
 
 
 class MTextBlock:
+    __slots__ = ("bbox", "number", "lines")
+
     bbox: Rectangle
     number: int
     lines: list[MLine]
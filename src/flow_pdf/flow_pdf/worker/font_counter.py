@@ -1,11 +1,11 @@
-from .common import PageWorker
+from .common import SampledPageWorker
 from .common import (
     DocInputParams,
     PageInputParams,
     DocOutputParams,
     PageOutputParams,
     LocalPageOutputParams,
-    frequent_sub_array,
+    frequent_window,
 )
 
 
@@ -41,7 +41,15 @@ class LocalPageOutParams(LocalPageOutputParams):
     size_counter: dict[float, int]
 
 
-class FontCounterWorker(PageWorker):
+class FontCounterWorker(SampledPageWorker):
+    reads_pdf = False
+
+    def estimates_agree(self, a: DocOutParams, b: DocOutParams) -> bool:  # type: ignore[override]
+        return (
+            a.most_common_font == b.most_common_font
+            and a.common_size_range == b.common_size_range
+        )
+
     def run_page(  # type: ignore[override]
         self, page_index: int, doc_in: DocInParams, page_in: PageInParams
     ) -> tuple[PageOutParams, LocalPageOutParams]:
@@ -106,17 +114,9 @@ class FontCounterWorker(PageWorker):
             self.logger.info(f"most_common_size_radio is {most_common_size_radio}")
             most_common_size = 0
 
-            size_list: list[float] = []
-            for s, c in size_counter.items():
-                for _ in range(c):
-                    size_list.append(s)
-
-            if not size_list:
-                raise ValueError("size_list is empty")
-
-            frequent_size_list = frequent_sub_array(size_list, 3)
-            radio = len(frequent_size_list) / len(size_list)
+            size_min, size_max, size_count = frequent_window(size_counter, 3)
+            radio = size_count / sum(size_counter.values())
             self.logger.debug(f"frequent size list radio is {radio}")
-            common_size_range = Range(min(frequent_size_list), max(frequent_size_list))
+            common_size_range = Range(size_min, size_max)
 
         return DocOutParams(most_common_font, common_size_range)
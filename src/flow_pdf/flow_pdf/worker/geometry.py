@@ -0,0 +1,114 @@
+"""
+batched versions of the rectangle helpers of common.py, rects are float arrays whose last axis is (x0, y0, x1, y1).
+
+a (4,) rect against (N, 4) rects gives (N,) results, relation_matrix gives (N, M) for (N, 4) against (M, 4).
+"""
+import numpy as np
+
+from .flow_type import Rectangle, init_rectangle_unchecked
+
+# values of common.RectRelation
+NOT_INTERSECT = 0
+CONTAINS = 1
+CONTAINED_BY = 2
+INTERSECT = 3
+
+
+def to_array(rects) -> np.ndarray:
+    """
+    (N, 4) array of Rectangle or fitz.Rect
+    """
+    return np.array(
+        [(r.x0, r.y0, r.x1, r.y1) for r in rects], dtype=np.float64
+    ).reshape(-1, 4)
+
+
+def to_rectangle(a: np.ndarray) -> Rectangle:
+    return init_rectangle_unchecked(*a.tolist())
+
+
+def intersects(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    mask of rectangle_relation(a, b) != NOT_INTERSECT, touching edges don't intersect
+    """
+    return (
+        (a[..., 2] > b[..., 0])
+        & (a[..., 0] < b[..., 2])
+        & (a[..., 3] > b[..., 1])
+        & (a[..., 1] < b[..., 3])
+    )
+
+
+def contains(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    mask of a containing b, edges included
+    """
+    return (
+        (a[..., 0] <= b[..., 0])
+        & (a[..., 1] <= b[..., 1])
+        & (a[..., 2] >= b[..., 2])
+        & (a[..., 3] >= b[..., 3])
+    )
+
+
+def relation(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    rectangle_relation of a and b, as int8 values of RectRelation
+    """
+    return np.select(
+        [~intersects(a, b), contains(a, b), contains(b, a)],
+        [NOT_INTERSECT, CONTAINS, CONTAINED_BY],
+        INTERSECT,
+    ).astype(np.int8)
+
+
+def relation_mask(a: np.ndarray, b: np.ndarray, value: int) -> np.ndarray:
+    """
+    relation(a, b) == value, without computing the other relations
+    """
+    mask = intersects(a, b)
+    if value == NOT_INTERSECT:
+        return ~mask
+    if value == CONTAINS:
+        return mask & contains(a, b)
+    mask &= ~contains(a, b)
+    if value == CONTAINED_BY:
+        return mask & contains(b, a)
+    return mask & ~contains(b, a)
+
+
+def relation_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    (N, M) relations of each rect of a with each rect of b
+    """
+    return relation(a[:, np.newaxis, :], b[np.newaxis, :, :])
+
+
+def union(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    bounding rect of a and b, element wise
+    """
+    return np.concatenate(
+        [np.minimum(a[..., :2], b[..., :2]), np.maximum(a[..., 2:], b[..., 2:])],
+        axis=-1,
+    )
+
+
+def intersection(a: np.ndarray, b: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    common area of a and b element wise, and the mask of pairs where it isn't empty.
+
+    the rects of empty pairs have x0 > x1 or y0 > y1
+    """
+    r = np.concatenate(
+        [np.maximum(a[..., :2], b[..., :2]), np.minimum(a[..., 2:], b[..., 2:])],
+        axis=-1,
+    )
+    return r, intersects(a, b)
+
+
+def bounding_rect(rects: np.ndarray) -> np.ndarray:
+    """
+    get_min_bounding_rect of (N, 4) rects, N > 0
+    """
+    return np.concatenate([rects[:, :2].min(axis=0), rects[:, 2:].max(axis=0)])
@@ -10,6 +10,7 @@ from htutil import file
 from pathlib import Path
 from dataclasses import dataclass
 from bs4 import BeautifulSoup
+from html import escape
 
 
 @dataclass
@@ -32,6 +33,32 @@ class PageOutParams(PageOutputParams):
     pass
 
 
+def make_skeleton(html: str, meta: dict) -> tuple[str, str]:
+    """
+    the prettified template, split around the content of body
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    # add version to head
+    for k, v in meta.items():
+        soup.html.head.append(soup.new_tag("meta", attrs={"name": k, "content": v}))  # type: ignore
+
+    text = soup.prettify()
+    i = text.index(" <body>\n") + len(" <body>\n")
+    return text[:i], text[i:]
+
+
+def format_img(src: str, class_: str, indent: str) -> str:
+    return f'{indent}<img class="{class_}" src="{escape(src)}"/>\n'
+
+
+def format_text(text: str, indent: str) -> str:
+    # prettify() strips text nodes and drops blank ones
+    text = text.strip()
+    if not text:
+        return ""
+    return f"{indent}{escape(text, quote=False)}\n"
+
+
 class HTMLGenWorker(Worker):
     def __init__(self) -> None:
         super().__init__()
@@ -44,47 +71,37 @@ class HTMLGenWorker(Worker):
         doc = file.read_json(doc_in.dir_output / "output" / "doc.json")
 
         html = file.read_text(Path(__file__).parent / "template.html")
+        # same text as appending tags to a BeautifulSoup tree and calling prettify(), without building the tree
+        head, tail = make_skeleton(html, doc["meta"])
+
+        def format_element(element) -> str:
+            if element["type"] == "paragraph":
+                t = ["  <p>\n"]
+
+                for c in element["children"]:
+                    if c["type"] == "text":
+                        t.append(format_text(c["text"], "   "))
+                    elif c["type"] == "shot":
+                        t.append(format_img(c["path"], "inline-img", "   "))
+                    else:
+                        self.logger.warning(f"unknown child type {c['type']}")
+                # for two column layout, paragraph ends with a shot will crash, so add a dot
+                if element["children"][-1]["type"] == "shot":
+                    t.append("   .\n")
+                t.append("  </p>\n")
+                return "".join(t)
+            elif element["type"] == "shot":
+                return format_img(element["path"], "shot", "  ")
+            else:
+                self.logger.warning(f"unknown element type {element['type']}")
+                return ""
 
         def mk_html(elements, dest: Path):
-            soup = BeautifulSoup(html, "html.parser")
-
-            # add version to head
-            for k, v in doc["meta"].items():
-                soup.html.head.append(soup.new_tag("meta", attrs={"name": k, "content": v}))  # type: ignore
-
-            for element in elements:
-                if element["type"] == "paragraph":
-                    t = soup.new_tag("p")
-
-                    for c in element["children"]:
-                        if c["type"] == "text":
-                            t.append(c["text"])
-                            # span = soup.new_tag("span")
-                            # span.append(c["text"])
-                            # t.append(
-                            #     span
-                            # )
-                            
-                        elif c["type"] == "shot":
-                            t.append(
-                                soup.new_tag(
-                                    "img", src=c["path"], attrs={"class": "inline-img"}
-                                )
-                            )
-                        else:
-                            self.logger.warning(f"unknown child type {c['type']}")
-                    # for two column layout, paragraph ends with a shot will crash, so add a dot
-                    if element["children"][-1]["type"] == "shot":
-                        t.append(".")
-                    soup.html.body.append(t)  # type: ignore
-                elif element["type"] == "shot":
-                    t = soup.new_tag(
-                        "img", src=element["path"], attrs={"class": "shot"}
-                    )
-                    soup.html.body.append(t)  # type: ignore
-                else:
-                    self.logger.warning(f"unknown element type {element['type']}")
-            file.write_text(dest, soup.prettify())
+            with open(dest, "w", encoding="utf-8", errors="ignore") as f:
+                f.write(head)
+                for element in elements:
+                    f.write(format_element(element))
+                f.write(tail)
 
         BIG_ELEMENT_SIZE = 5000
 
@@ -97,23 +114,13 @@ class HTMLGenWorker(Worker):
                     doc["elements"][i * PER_HTML_ELEMENTS : (i + 1) * PER_HTML_ELEMENTS],
                     doc_in.dir_output / "output" / f"part_{i}.html",
                 )
-            
-            # make index
-            soup = BeautifulSoup(html, "html.parser")
-            # add version to head
-            for k, v in doc["meta"].items():
-                soup.html.head.append(soup.new_tag("meta", attrs={"name": k, "content": v}))  # type: ignore
-
-            for i in range(0, int(len(doc["elements"]) / PER_HTML_ELEMENTS) + 1):
-                a = soup.new_tag(
-                        "a", href=f"part_{i}.html", attrs={"class": "part-link"}
-                    )
-                a.string = f"part_{i}"
-                soup.html.body.append(a) # type: ignore
-
-                soup.html.body.append(soup.new_tag("br")) # type: ignore
-
-            file.write_text(doc_in.dir_output / "output" / "index.html", soup.prettify())
 
+            # make index
+            with open(doc_in.dir_output / "output" / "index.html", "w", encoding="utf-8", errors="ignore") as f:
+                f.write(head)
+                for i in range(0, int(len(doc["elements"]) / PER_HTML_ELEMENTS) + 1):
+                    f.write(f'  <a class="part-link" href="part_{i}.html">\n   part_{i}\n  </a>\n')
+                    f.write("  <br/>\n")
+                f.write(tail)
 
         return DocOutParams(), []
@@ -39,6 +39,8 @@ class LocalPageOutParams(LocalPageOutputParams):
 
 
 class ImageWorker(PageWorker):
+    reads_pdf = False
+
     def run_page(  # type: ignore[override]
         self, page_index: int, doc_in: DocInParams, page_in: PageInParams
     ) -> tuple[PageOutParams, LocalPageOutParams]:
@@ -1,4 +1,6 @@
 import io
+import json
+import time
 from .common import PageWorker, is_common_span, get_min_bounding_rect
 from .common import (
     DocInputParams,
@@ -8,7 +10,6 @@ from .common import (
     LocalPageOutputParams,
 )
 from fitz import Document, Page, TextPage  # type: ignore
-from htutil import file
 import fitz
 import fitz.utils
 from pathlib import Path
@@ -28,17 +29,80 @@ from .flow_type import (
     MLine,
     MSpan,
 )
-from typing import Optional
-
-def convert_img_to_webp(file_img: Path) -> Path:
-    '''
-    convert image to webp format, and return the path of the converted image
-    '''
-    file_webp = file_img.parent / f"{file_img.stem}.webp"
-    with Image.open(file_img) as img:
-        img.save(file_webp, "webp")
-    # file_img.unlink()
-    return file_webp
+from typing import Iterable, Iterator, Optional
+from .shot_encoder import ShotEncoder
+
+def get_first_char(element) -> str:
+    for sp in element["children"]:
+        if sp["type"] == "text":
+            return sp["text"][0]
+    return ""
+
+
+def get_last_char(element) -> str:
+    for sp in reversed(element["children"]):
+        if sp["type"] == "text":
+            return sp["text"][-1]
+    return ""
+
+
+def combine_paragraphs(elements: Iterable[dict]) -> Iterator[dict]:
+    """
+    join a paragraph to the previous one when the sentence goes on, like a paragraph split by a page or column break.
+
+    whether two elements are joined only depends on them, so only the paragraph being built is kept
+    """
+
+    def is_valid(c: str):
+        return c.islower() or c in " "
+
+    current = None  # output element, grows while paragraphs are joined to it
+    prev = None  # last input element
+    for cur in elements:
+        if (
+            current is not None
+            and cur["type"] == "paragraph"
+            and prev["type"] == "paragraph"  # type: ignore
+        ):
+            cur_first_c = get_first_char(cur)
+            prev_last_c = get_last_char(prev)
+            if (
+                cur_first_c
+                and prev_last_c
+                and is_valid(cur_first_c)
+                and is_valid(prev_last_c)
+            ):
+                current["children"].extend(cur["children"])
+                prev = cur
+                continue
+
+        if current is not None:
+            yield current
+        current = cur
+        prev = cur
+
+    if current is not None:
+        yield current
+
+
+def write_doc_json(file_json: Path, meta: dict, elements: Iterable[dict]):
+    """
+    same text as file.write_json({"meta": meta, "elements": [...]}), but elements are written one by one as they come
+    """
+
+    def dumps(obj, indent: str) -> str:
+        # json strings never contain a raw newline
+        return json.dumps(obj, indent=4, ensure_ascii=False).replace("\n", "\n" + indent)
+
+    file_json.parent.mkdir(parents=True, exist_ok=True)
+    with open(file_json, "w", encoding="utf-8", errors="ignore") as f:
+        f.write('{\n    "meta": ' + dumps(meta, " " * 4) + ',\n    "elements": [')
+        empty = True
+        for e in elements:
+            f.write(("\n" if empty else ",\n") + " " * 8 + dumps(e, " " * 8))
+            empty = False
+        f.write("]\n}" if empty else "\n    ]\n}")
+
 
 @dataclass
 class DocInParams(DocInputParams):
@@ -83,6 +147,28 @@ class JSONGenWorker(PageWorker):
     ) -> tuple[PageOutParams, LocalPageOutParams]:
         with fitz.open(doc_in.file_input) as doc:  # type: ignore
             page: Page = doc.load_page(page_index)
+            encoder = ShotEncoder(self.webp)
+
+            # the content stream of the page is interpreted once, inline shots are rasterized from it
+            display_list: Optional[fitz.DisplayList] = None
+            inline_shot_count = 0
+            inline_render_time = 0.0
+
+            def get_display_list() -> fitz.DisplayList:
+                nonlocal display_list
+                if display_list is None:
+                    display_list = page.get_displaylist()
+                return display_list
+
+            def save_inline_shot(r_tuple: tuple, file_dest: Path):
+                nonlocal inline_shot_count, inline_render_time
+
+                start = time.perf_counter()
+                zoom = 576 / 72
+                pix = get_display_list().get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=r_tuple, alpha=False)  # type: ignore
+                encoder.submit(pix, file_dest)
+                inline_render_time += time.perf_counter() - start
+                inline_shot_count += 1
 
             def crop_image(f: Path):
                 with Image.open(f) as img:
@@ -90,22 +176,19 @@ class JSONGenWorker(PageWorker):
                     img = img.crop(ImageChops.difference(img, bg).getbbox())
                     img.save(f)
 
-            def save_shot_pixmap(shot: list[Rectangle], file_dest: Path):
-                x = []
-                for s in shot:
-                    x.append(s.__dict__)
+            def get_shot_pixmap(shot: list[Rectangle]) -> fitz.Pixmap:
                 if len(shot) == 1:
-                    page.get_pixmap(clip=get_min_bounding_rect(shot).to_tuple(), dpi=288).save(file_dest)  # type: ignore
-                    return
+                    return page.get_pixmap(clip=get_min_bounding_rect(shot).to_tuple(), dpi=288)  # type: ignore
 
                 for i in range(len(shot) - 1):
                     if shot[i].x1 >= shot[i + 1].x0:
                         self.logger.warning(
                             f"Shot rect not increasing in x: {shot[i]} {shot[i+1]}"
                         )
-                        page.get_pixmap(clip=get_min_bounding_rect(shot).to_tuple(), dpi=288).save(file_dest)  # type: ignore
-                        return
+                        return page.get_pixmap(clip=get_min_bounding_rect(shot).to_tuple(), dpi=288)  # type: ignore
 
+                # the white rects are drawn into the document, inline shots of later columns must not see them
+                get_display_list()
                 page_shot: Page = doc.load_page(page_index)
                 min_y = min([s.y0 for s in shot])
                 max_y = max([s.y1 for s in shot])
@@ -115,7 +198,7 @@ class JSONGenWorker(PageWorker):
                         page_shot.draw_rect((r.x0, min_y, r.x1, r.y0), color=color, fill=color)  # type: ignore
                     if r.y1 < max_y:
                         page_shot.draw_rect((r.x0, r.y1, r.x1, max_y), color=color, fill=color)  # type: ignore
-                page_shot.get_pixmap(clip=get_min_bounding_rect(shot).to_tuple(), dpi=288).save(file_dest)  # type: ignore
+                return page_shot.get_pixmap(clip=get_min_bounding_rect(shot).to_tuple(), dpi=288)  # type: ignore
 
             def get_span_type(span: MSpan):
                 if is_common_span(
@@ -261,7 +344,7 @@ class JSONGenWorker(PageWorker):
                                         doc_in.dir_output
                                         / "output"
                                         / "assets"
-                                        / f"page_{page_index}_shot_{shot_counter}.png"
+                                        / f"page_{page_index}_shot_{shot_counter}.webp"
                                     )
                                     shot_counter += 1
                                     # x0 = group.spans[0].bbox.x0
@@ -288,8 +371,7 @@ class JSONGenWorker(PageWorker):
                                             f"page[{page_index}] Shot rect invalid: {r}"
                                         )
                                     else:
-                                        page.get_pixmap(clip=r_tuple, dpi=576).save(file_shot)  # type: ignore
-                                        file_shot = convert_img_to_webp(file_shot)
+                                        save_inline_shot(r_tuple, file_shot)
                                         chidren.append(
                                             {
                                                 "type": "shot",
@@ -305,13 +387,9 @@ class JSONGenWorker(PageWorker):
                         doc_in.dir_output
                         / "output"
                         / "assets"
-                        / f"page_{page_index}_shot_{shot_counter}.png"
+                        / f"page_{page_index}_shot_{shot_counter}.webp"
                     )
-                    save_shot_pixmap(shot, file_shot)
-                    # crop_image(file_shot)
-
-
-                    file_shot = convert_img_to_webp(file_shot)
+                    encoder.submit(get_shot_pixmap(shot), file_shot)
                     shot_counter += 1
 
                     column_block_elements.append(
@@ -327,6 +405,12 @@ class JSONGenWorker(PageWorker):
                     del e["y0"]
                 block_elements.extend(column_block_elements)
 
+            encoder.wait()
+
+            self.logger.debug(
+                f"page[{page_index}] inline shots = {inline_shot_count}, render time = {inline_render_time:.2f}s"
+            )
+
         return PageOutParams(inline_shots), LocalPageOutParams(block_elements)
 
     def post_run_page(self, doc_in: DocInParams, page_in: list[PageInParams]):  # type: ignore[override]
@@ -339,42 +423,11 @@ class JSONGenWorker(PageWorker):
         page_out: list[PageOutParams],
         local_page_out: list[LocalPageOutParams],
     ) -> DocOutParams:
-        elements = []
-        for p in local_page_out:
-            elements.extend(p.elements)
-
-        # combine paragraphs
-        for i in reversed(range(1, len(elements))):
-            cur = elements[i]
-            prev = elements[i - 1]
-
-            if cur["type"] == "paragraph" and prev["type"] == "paragraph":
-                cur_first_c = ""
-                for sp in cur["children"]:
-                    if sp["type"] == "text":
-                        cur_first_c = sp["text"][0]
-                        break
-                if not cur_first_c:
-                    continue
-
-                prev_last_c = ""
-                for sp in reversed(prev["children"]):
-                    if sp["type"] == "text":
-                        prev_last_c = sp["text"][-1]
-                        break
-                if not prev_last_c:
-                    continue
-
-                def is_valid(c: str):
-                    return c.islower() or c in " "
-
-                if is_valid(cur_first_c) and is_valid(prev_last_c):
-                    elements[i - 1]["children"].extend(elements[i]["children"])
-                    del elements[i]
-
-        file.write_json(
+        elements = (e for p in local_page_out for e in p.elements)
+        write_doc_json(
             doc_in.dir_output / "output" / "doc.json",
-            {"meta": {"flow-pdf-version": self.version}, "elements": elements},
+            {"flow-pdf-version": self.version},
+            combine_paragraphs(elements),
         )
 
         return DocOutParams()
@@ -0,0 +1,88 @@
+from .common import Worker
+from .common import (
+    DocInputParams,
+    PageInputParams,
+    DocOutputParams,
+    PageOutputParams,
+)
+from pathlib import Path
+from dataclasses import dataclass
+import hashlib
+import gzip
+import json
+
+try:
+    import brotli  # type: ignore
+except ImportError:
+    brotli = None
+
+# precompressed next to the file, like index.html.gz
+COMPRESS_SUFFIXES = [".html"]
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+@dataclass
+class DocInParams(DocInputParams):
+    pass
+
+
+@dataclass
+class PageInParams(PageInputParams):
+    pass
+
+
+@dataclass
+class DocOutParams(DocOutputParams):
+    pass
+
+
+@dataclass
+class PageOutParams(PageOutputParams):
+    pass
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=11)  # type: ignore
+    # mtime 0, the same html gives the same .gz
+    return gzip.compress(data, 9, mtime=0)
+
+
+def make_entry(data: bytes) -> dict:
+    return {"size": len(data), "etag": hashlib.sha256(data).hexdigest()}
+
+
+class ManifestWorker(Worker):
+    """
+    writes .html.br (when brotli is installed) and .html.gz next to the html files, and manifest.json,
+    the size and sha256 of every file of the output and of its compressed variants, used as strong ETags by be.py
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+
+        self.disable_cache = True
+
+    def run(
+        self, doc_in: DocInputParams, page_in: list[PageInputParams]
+    ) -> tuple[DocOutputParams, list[PageOutputParams]]:
+        dir_output = doc_in.dir_output / "output"
+        encodings = [e for e in ENCODING_SUFFIXES if e != "br" or brotli is not None]
+        variant_suffixes = tuple(ENCODING_SUFFIXES.values())
+
+        files = {}
+        for f in sorted(dir_output.rglob("*")):
+            if not f.is_file() or f.name == "manifest.json" or f.name.endswith(variant_suffixes):
+                continue
+            data = f.read_bytes()
+            entry = make_entry(data)
+            if f.suffix in COMPRESS_SUFFIXES:
+                entry["encodings"] = {}
+                for e in encodings:
+                    c = compress(data, e)
+                    Path(f"{f}{ENCODING_SUFFIXES[e]}").write_bytes(c)
+                    entry["encodings"][e] = make_entry(c)
+            files[f.relative_to(dir_output).as_posix()] = entry
+
+        (dir_output / "manifest.json").write_text(json.dumps({"files": files}, indent=4))
+        return DocOutParams(), []
@@ -1,4 +1,5 @@
 from .common import PageWorker, add_annot
+from .cache import update_hash
 from .common import (
     DocInputParams,
     PageInputParams,
@@ -7,11 +8,15 @@ from .common import (
     LocalPageOutputParams,
 )
 from .flow_type import MSimpleBlock, MPage, init_mpage_from_mupdf, Rectangle
+from .compact_page import init_compact_page_from_mupdf
 
 
 import fitz
+import time
+import hashlib
 from fitz import Page  # type: ignore
 from dataclasses import dataclass
+from typing import Any, Optional
 from htutil import file
 
 
@@ -32,41 +37,87 @@ class DocOutParams(DocOutputParams):
 
 @dataclass
 class PageOutParams(PageOutputParams):
-    page_info: MPage
-    drawings: list
-    blocks: list[MSimpleBlock]
-    images: list
+    # None when no registered worker reads it
+    page_info: Optional[MPage]
+    drawings: Optional[list]
+    blocks: Optional[list[MSimpleBlock]]
+    images: Optional[list]
     width: int
     height: int
 
 
 @dataclass
 class LocalPageOutParams(LocalPageOutputParams):
-    pass
+    extract_time: dict[str, float]  # artifact -> seconds
+
+
+class PageExtractor:
+    """
+    extracts an artifact of the page on first access, and keeps it with the time it took
+    """
+
+    def __init__(self, page: Page, worker: PageWorker):
+        self.page = page
+        self.worker = worker
+        self.values: dict[str, Any] = {}
+        self.times: dict[str, float] = {}
+
+    def get(self, name: str):
+        if name not in self.values:
+            start = time.perf_counter()
+            self.values[name] = getattr(self, f"extract_{name}")()
+            self.times[name] = time.perf_counter() - start
+        return self.values[name]
+
+    def extract_page_info(self) -> MPage:
+        raw_dict = self.page.get_text("rawdict")  # type: ignore
+        return init_compact_page_from_mupdf(raw_dict)
+
+    def extract_drawings(self) -> list:
+        try:
+            return self.page.get_drawings()
+        except Exception as e:
+            self.worker.logger.warning(f"get_drawings failed: {e}")
+            return []
+
+    def extract_blocks(self) -> list[MSimpleBlock]:
+        return [MSimpleBlock(b) for b in self.page.get_text("blocks")]  # type: ignore
+
+    def extract_images(self) -> list:
+        return self.page.get_image_info()  # type: ignore
 
 
 class ReadDocWorker(PageWorker):
+    ARTIFACTS = ["page_info", "drawings", "blocks", "images"]
+
+    def doc_cache_hash(self, doc_in: DocInputParams) -> "hashlib._Hash":
+        # the artifacts left out depend on the workers registered after this one
+        h = super().doc_cache_hash(doc_in)
+        update_hash(h, [a for a in ReadDocWorker.ARTIFACTS if self.is_output_used(a)])
+        return h
+
     def run_page(  # type: ignore[override]
         self, page_index: int, doc_in: DocInParams, page_in: PageInParams
     ) -> tuple[PageOutParams, LocalPageOutParams]:
         with fitz.open(doc_in.file_input) as doc:  # type: ignore
             page: Page = doc.load_page(page_index)
+            extractor = PageExtractor(page, self)
 
-            raw_dict = page.get_text("rawdict")  # type: ignore
-            page_info = init_mpage_from_mupdf(raw_dict)
-            try:
-                drawings = page.get_drawings()
-            except Exception as e:
-                self.logger.warning(f"get_drawings failed: {e}")
-                drawings = []
-            blocks = [MSimpleBlock(b) for b in page.get_text("blocks")]  # type: ignore
-            images = page.get_image_info()  # type: ignore
+            def get(name: str):
+                return extractor.get(name) if self.is_output_used(name) else None
 
             width, height = page.mediabox_size
 
             return (
-                PageOutParams(page_info, drawings, blocks, images, width, height),
-                LocalPageOutParams(),
+                PageOutParams(
+                    get("page_info"),
+                    get("drawings"),
+                    get("blocks"),
+                    get("images"),
+                    width,
+                    height,
+                ),
+                LocalPageOutParams(extractor.times),
             )
 
     def after_run_page(  # type: ignore[override]
@@ -97,4 +148,13 @@ class ReadDocWorker(PageWorker):
             #     f"page_out[{idx}].width = {page_out[idx].width}, page_out[{idx}].height = {page_out[idx].height}"
             # )
 
+        extract_time: dict[str, float] = {}
+        for p in local_page_out:
+            for name, t in p.extract_time.items():
+                extract_time[name] = extract_time.get(name, 0) + t
+        self.logger.info(
+            "extract time: "
+            + ", ".join(f"{name} = {t:.2f}s" for name, t in extract_time.items())
+        )
+
         return DocOutParams(abnormal_size_pages)
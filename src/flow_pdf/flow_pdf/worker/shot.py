@@ -3,6 +3,7 @@ from .common import (
     get_min_bounding_rect,
     rectangle_relation,
     RectRelation,
+    RectIndex,
 )
 from .common import (
     DocInputParams,
@@ -82,6 +83,8 @@ def shot_between_blocks(
 
 
 class ShotWorker(PageWorker):
+    reads_pdf = False
+
     def run_page(  # type: ignore[override]
         self, page_index: int, doc_in: DocInParams, page_in: PageInParams
     ) -> tuple[PageOutParams, LocalPageOutParams]:
@@ -104,6 +107,7 @@ class ShotWorker(PageWorker):
             elements_rect.append(block.bbox)
         for draw in page_in.drawings:
             elements_rect.append(draw["rect"])
+        elements_index = RectIndex(elements_rect, page_in.width, page_in.height)
 
         # remove top and bottom blank
         for shots in column_shots:
@@ -112,10 +116,7 @@ class ShotWorker(PageWorker):
                 if len(shot) != 1:
                     raise Exception("len(shot) != 1")
 
-                except_intersect_rects = []
-                for r in elements_rect:
-                    if rectangle_relation(shot[0], r) != RectRelation.NOT_INTERSECT:
-                        except_intersect_rects.append(r)
+                except_intersect_rects = elements_index.search_rects(shot[0])
                 if except_intersect_rects:
                     min_y0 = min([r.y0 for r in except_intersect_rects])
                     min_y0 = max(min_y0, shot[0].y0)
@@ -131,10 +132,10 @@ class ShotWorker(PageWorker):
             if len(first_shot) != 1:
                 raise Exception("len(first_shot) != 1")
 
-            intersect_rects: list[Rectangle] = []  # elements intersect with rect
-            for r in elements_rect:
-                if rectangle_relation(first_shot[0], r) == RectRelation.INTERSECT:
-                    intersect_rects.append(r)
+            # elements intersect with rect
+            intersect_rects: list[Rectangle] = elements_index.search_rects(
+                first_shot[0], RectRelation.INTERSECT
+            )
 
             if not intersect_rects:
                 continue
@@ -156,9 +157,8 @@ class ShotWorker(PageWorker):
                     raise Exception("len(column[i]) != 1")
                 shot = column[i]
                 min_x0 = shot[0].x0
-                for r in elements_rect:
-                    if rectangle_relation(shot[0], r) == RectRelation.INTERSECT:
-                        min_x0 = min(min_x0, r.x0)
+                for r in elements_index.search_rects(shot[0], RectRelation.INTERSECT):
+                    min_x0 = min(min_x0, r.x0)
                 shot[0] = Rectangle(min_x0, shot[0].y0, shot[0].x1, shot[0].y1)
 
         # extend right
@@ -169,9 +169,8 @@ class ShotWorker(PageWorker):
                     raise Exception("len(column[i]) != 1")
                 shot = column[i]
                 max_x1 = shot[0].x1
-                for r in elements_rect:
-                    if rectangle_relation(shot[0], r) == RectRelation.INTERSECT:
-                        max_x1 = max(max_x1, r.x1)
+                for r in elements_index.search_rects(shot[0], RectRelation.INTERSECT):
+                    max_x1 = max(max_x1, r.x1)
                 shot[0] = Rectangle(shot[0].x0, shot[0].y0, max_x1, shot[0].y1)
 
         # delete empty rects
@@ -193,12 +192,7 @@ class ShotWorker(PageWorker):
                     shot[0].x1 - BORDER_WIDTH,
                     shot[0].y1 - BORDER_WIDTH,
                 )
-                is_found = False
-                for r in elements_rect:
-                    if rectangle_relation(inner_rect, r) != RectRelation.NOT_INTERSECT:
-                        is_found = True
-                        break
-                if not is_found:
+                if not elements_index.search(inner_rect):
                     del shots[i]
 
         # merge shot in different columns
@@ -206,11 +200,8 @@ class ShotWorker(PageWorker):
         def is_near(shot1: Shot, shot2: Shot):
             rect1 = get_min_bounding_rect(shot1)
             rect2 = get_min_bounding_rect(shot2)
-            for r in elements_rect:
-                if (
-                    rectangle_relation(rect1, r) == RectRelation.INTERSECT
-                    and rectangle_relation(rect2, r) == RectRelation.INTERSECT
-                ):
+            for r in elements_index.search_rects(rect1, RectRelation.INTERSECT):
+                if rectangle_relation(rect2, r) == RectRelation.INTERSECT:
                     return True
             return False
 
@@ -0,0 +1,103 @@
+from pathlib import Path
+from dataclasses import dataclass
+from typing import Optional
+import os
+import threading
+import concurrent.futures
+
+import fitz
+from PIL import Image
+
+# PIL releases the GIL while encoding, a few threads per process are enough
+ENCODER_THREADS = min(4, os.cpu_count() or 1)
+# pixmaps rendered but not encoded yet, bounds the memory of a page with many shots
+MAX_PENDING = 2 * ENCODER_THREADS
+
+# shots with at most this many colors are line art, see WebpOptions.lossless
+LINE_ART_MAX_COLORS = 256
+
+
+@dataclass
+class WebpOptions:
+    # PIL defaults
+    quality: int = 80
+    method: int = 4
+    # never, always, or auto: lossless for line art, like formulas and diagrams
+    lossless: str = "never"
+
+
+def is_line_art(img: Image.Image) -> bool:
+    return img.getcolors(LINE_ART_MAX_COLORS) is not None
+
+
+def save_pixmap_as_webp(pix: fitz.Pixmap, file_webp: Path, options: WebpOptions):
+    """
+    encode a RGB pixmap to webp, reading its samples in place instead of through a png file
+    """
+    with Image.frombuffer(
+        "RGB", (pix.width, pix.height), pix.samples_mv, "raw", "RGB", pix.stride, 1
+    ) as img:
+        if options.lossless == "always":
+            lossless = True
+        elif options.lossless == "auto":
+            lossless = is_line_art(img)
+        else:
+            lossless = False
+        img.save(
+            file_webp,
+            "webp",
+            quality=options.quality,
+            method=options.method,
+            lossless=lossless,
+        )
+
+
+_encoder_pool: Optional[concurrent.futures.ThreadPoolExecutor] = None
+_encoder_pool_pid = 0
+
+
+def get_encoder_pool() -> concurrent.futures.ThreadPoolExecutor:
+    """
+    one pool per process, a pool inherited through fork has no threads
+    """
+    global _encoder_pool, _encoder_pool_pid
+    if _encoder_pool is None or _encoder_pool_pid != os.getpid():
+        _encoder_pool = concurrent.futures.ThreadPoolExecutor(
+            ENCODER_THREADS, thread_name_prefix="shot-encoder"
+        )
+        _encoder_pool_pid = os.getpid()
+    return _encoder_pool
+
+
+class ShotEncoder:
+    """
+    encodes the shots of a page on the encoder pool, submit blocks while MAX_PENDING shots are waiting
+    """
+
+    def __init__(self, options: WebpOptions):
+        self.options = options
+        self.executor = get_encoder_pool()
+        self.pending = threading.BoundedSemaphore(MAX_PENDING)
+        self.futures: list[concurrent.futures.Future] = []
+
+    def submit(self, pix: fitz.Pixmap, file_webp: Path):
+        # the task keeps pix alive, img reads its memory
+        self.pending.acquire()
+        try:
+            future = self.executor.submit(
+                save_pixmap_as_webp, pix, file_webp, self.options
+            )
+        except BaseException:
+            self.pending.release()
+            raise
+        future.add_done_callback(lambda _: self.pending.release())
+        self.futures.append(future)
+
+    def wait(self):
+        """
+        raises the first error after all shots are done
+        """
+        futures, self.futures = self.futures, []
+        concurrent.futures.wait(futures)
+        for future in futures:
+            future.result()
@@ -1,11 +1,12 @@
-from .common import PageWorker
+from .common import SampledPageWorker
 from .common import (
     DocInputParams,
     PageInputParams,
     DocOutputParams,
     PageOutputParams,
     LocalPageOutputParams,
-    frequent_sub_array,
+    frequent_window,
+    dbscan_1d,
 )
 from .flow_type import (
     MSimpleBlock,
@@ -17,9 +18,7 @@ from .flow_type import (
     MLine,
 )
 
-import numpy as np
 from dataclasses import dataclass
-from sklearn.cluster import DBSCAN
 from collections import Counter
 
 
@@ -50,7 +49,27 @@ class LocalPageOutParams(LocalPageOutputParams):
     large_blocks: list[MTextBlock]
 
 
-class WidthCounterWorker(PageWorker):
+def is_range_near(a: Range, b: Range, tolerance: float) -> bool:
+    return abs(a.min - b.min) <= tolerance and abs(a.max - b.max) <= tolerance
+
+
+class WidthCounterWorker(SampledPageWorker):
+    reads_pdf = False
+
+    def estimates_agree(self, a: DocOutParams, b: DocOutParams) -> bool:  # type: ignore[override]
+        # same tolerances as the windows and clusters they come from
+        return (
+            is_range_near(a.big_text_width_range, b.big_text_width_range, 3)
+            and len(a.big_text_columns) == len(b.big_text_columns)
+            and all(
+                is_range_near(c_a, c_b, 10)
+                for c_a, c_b in zip(a.big_text_columns, b.big_text_columns)
+            )
+            and is_range_near(
+                a.big_text_line_height_range, b.big_text_line_height_range, 0.2
+            )
+        )
+
     def run_page(  # type: ignore[override]
         self, page_index: int, doc_in: DocInParams, page_in: PageInParams
     ) -> tuple[PageOutParams, LocalPageOutParams]:
@@ -80,20 +99,18 @@ class WidthCounterWorker(PageWorker):
     ) -> DocOutParams:
         blocks = [b for p in local_page_out for b in p.large_blocks]
 
-        widths = []
-        for block in blocks:
-            for line in block.lines:
-                widths.append(line.bbox.x1 - line.bbox.x0)
+        widths = Counter(
+            line.bbox.x1 - line.bbox.x0 for block in blocks for line in block.lines
+        )
 
         # self.logger.debug(f"widths: {widths}")
 
         if not widths:
             raise Exception("no big text found")
 
-        most_common_widths = frequent_sub_array(widths, 3)
-        # self.logger.debug(f"widths: {widths}, most_common_widths: {most_common_widths}")
+        width_min, width_max, _ = frequent_window(widths, 3)
 
-        width_range = Range(min(most_common_widths), max(most_common_widths))
+        width_range = Range(width_min, width_max)
         self.logger.debug(f"width_range: {width_range}")
 
         delta = width_range.max - width_range.min
@@ -113,7 +130,7 @@ class WidthCounterWorker(PageWorker):
                 f"most common label only has {len(big_text_block)} items, less than {BIG_TEXT_THRESHOLD * 100}% of total {len(blocks)} items"
             )
 
-        x0_list = np.array([b.bbox.x0 for b in big_text_block]).reshape(-1, 1)
+        x0_list = [b.bbox.x0 for b in big_text_block]
 
         if len(x0_list) <= 7:
             min_samples = 2
@@ -124,8 +141,7 @@ class WidthCounterWorker(PageWorker):
         else:
             min_samples = 5
 
-        db = DBSCAN(eps=10, min_samples=min_samples).fit(x0_list)  # type: ignore
-        labels = db.labels_
+        labels = dbscan_1d(x0_list, eps=10, min_samples=min_samples)
         # self.logger.debug(f"x0_list: {x0_list}, labels: {labels}")
 
         big_text_columns = []
@@ -164,8 +180,8 @@ class WidthCounterWorker(PageWorker):
                 if line.bbox.x1 - line.bbox.x0 > (b.bbox.x1 - b.bbox.x0) * 0.9:
                     lines.append(line)
 
-        lines_height = [line.bbox.y1 - line.bbox.y0 for line in lines]
-        most_common_heights = frequent_sub_array(lines_height, 0.2)
-        height_range = Range(min(most_common_heights), max(most_common_heights))
+        lines_height = Counter(line.bbox.y1 - line.bbox.y0 for line in lines)
+        height_min, height_max, _ = frequent_window(lines_height, 0.2)
+        height_range = Range(height_min, height_max)
 
         return DocOutParams(width_range, big_text_columns, height_range)